@@ -1,11 +1,13 @@
 import libtmux
-import os
+import subprocess
 import time
 
 class InteractiveTerminal:
     """
     一个使用 libtmux 实现的自动化交互式终端。
     """
+    # 等待单条命令完成的最长秒数
+    WAIT_TIMEOUT = 60.0
 
     def __init__(self, session_name: str = "interactive_terminal"):
         """
@@ -16,10 +18,11 @@ class InteractiveTerminal:
         """
         self.server = libtmux.Server()
         # 如果已存在同名会话，先杀掉，确保每次都是全新的会话
-        if self.server.find_where({"session_name": session_name}):
+        if self.server.has_session(session_name):
             self.server.kill_session(session_name)
         self.session_name = session_name
         self.session = self.server.new_session(session_name=self.session_name, attach=False)
+        self._counter = 0
 
     def get_active_pane(self):
         """
@@ -30,13 +33,35 @@ class InteractiveTerminal:
         """
         return self.session.active_pane
 
+    def _send_and_wait(self, pane, command: str) -> bool:
+        """
+        发送命令并阻塞到命令执行完毕，通过 tmux wait-for 通道获得完成信号。
+
+        Args:
+            pane (libtmux.Pane): 目标窗格。
+            command (str): 要执行的命令。
+
+        Returns:
+            bool: 命令是否在 WAIT_TIMEOUT 秒内执行完毕。
+        """
+        channel_name = f"wait-{self._counter}"
+        self._counter += 1
+        pane.send_keys(f"{command}; tmux wait-for -S {channel_name}", enter=True)
+        try:
+            # libtmux 的 cmd() 不支持超时，这里直接调用 tmux 客户端
+            subprocess.run(['tmux', 'wait-for', channel_name], timeout=self.WAIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
     def run_command_sequence(self, commands: list, capture_file: str):
         """
         在 tmux 窗格中按顺序执行一系列命令，并记录整个过程。
         该方法遵循以下步骤：
         1. 运行 script 命令以开始记录。
         2. 依次执行用户定义的命令。
-        3. 运行 exit 以停止 script 并保存日志。
+        3. 发送最后一条命令，它结束后运行 exit 以停止 script 并保存日志。
+           最后一条命令可能需要交互，本方法不等待它完成。
 
         Args:
             commands (list): 要按顺序执行的命令字符串列表。
@@ -48,22 +73,28 @@ class InteractiveTerminal:
 
         # 步骤 1: 运行 script 命令以开始记录
         pane.send_keys(f"script {capture_file}", enter=True)
-        time.sleep(1)  # 给予 script 启动的时间
+        # 在 script 启动的子 shell 中发送信号，确认其已就绪
+        self._send_and_wait(pane, "true")
 
-        # 步骤 2: 依次执行所有提供的命令
-        for command in commands:
-            pane.send_keys(command, enter=True)
-            time.sleep(1.5)  # 模拟输入和等待，方便用户观察
+        # 步骤 2: 依次执行除最后一条外的命令，每条命令完成后才发送下一条
+        *leading, last = commands or ["true"]
+        for command in leading:
+            if not self._send_and_wait(pane, command):
+                # 多半是在等待用户输入，剩下的命令交给用户附加后处理
+                print(f"命令 '{command}' 在 {self.WAIT_TIMEOUT:g} 秒内未结束，不再发送后续命令。")
+                return
 
-        # 步骤 3: 运行 exit 以停止 script 会话
-        pane.send_keys("exit", enter=True)
+        # 步骤 3: 最后一条命令可能需要交互（例如输入 sudo 密码），不在这里等待它，
+        # 而是让它结束后由 shell 自己运行 exit 停止 script 会话，用户附加后即可完成交互
+        pane.send_keys(f"{last}; exit", enter=True)
 
     def attach_to_session(self):
         """
         附加到 tmux 会话，以便用户可以实时查看和交互。
         """
-        # 使用 os.system 来执行 attach，因为它能将控制权完全交给 tmux
-        os.system(f"tmux attach-session -t {self.session_name}")
+        # 直接以参数列表启动 tmux，不经过 /bin/sh 解析，会话名也无需转义；
+        # 分离后仍需回到 Python 打印日志位置，因此不使用 os.execvp
+        subprocess.run(['tmux', 'attach-session', '-t', self.session_name])
 
 if __name__ == '__main__':
     # 实例化终端对象
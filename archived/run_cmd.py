@@ -1,8 +1,29 @@
+import asyncio
 import subprocess
+import sys
+import time
 import platform
 import threading
 import os
-from typing import Optional, List
+import re
+import select
+import selectors
+import shlex
+import shutil
+import signal
+import tempfile
+from functools import lru_cache
+from typing import Optional, List, Tuple
+
+_IS_WINDOWS = platform.system() == "Windows"
+_HOME = os.path.expanduser("~")
+
+
+@lru_cache(maxsize=256)
+def _which(name: str) -> Optional[str]:
+    """缓存可执行文件的查找结果，避免每次启动都遍历 PATH。"""
+    return shutil.which(name)
+
 
 class CommandExecutor:
     """
@@ -11,58 +32,231 @@ class CommandExecutor:
     通过 `reset()` 方法为新命令重置状态，以避免在批量操作中
     重复创建对象的开销。
     """
+    __slots__ = ('encoding', 'command_string', 'cwd', 'shell', 'capture',
+                 '_returncode', '_stdout', '_stderr', '_executed')
+
+    # 含有这些字符的命令需要 shell 解析（管道、重定向、变量、通配符等）
+    _NEEDS_SHELL = re.compile(r'[|&;<>()$`\\"\'*?~#\[\]{}!=\n]')
+    # 子进程不再逐个关闭继承的 fd（close_fds=False），省去 fork 后遍历所有 fd 的开销。
+    # 前提：父进程里长期存在的 fd 都必须带 O_CLOEXEC（Python 默认创建不可继承的 fd，
+    # 自己用 os.pipe2 等创建时要显式传 os.O_CLOEXEC）。Windows 上保持默认行为。
+    _CLOSE_FDS = _IS_WINDOWS
+    # 流式输出的打印节奏：最多每 50ms 或每攒满 64KiB 写出一次
+    _FLUSH_INTERVAL = 0.05
+    _FLUSH_BYTES = 65536
+    # 只能由 shell 自身执行的内建命令
+    _SHELL_BUILTINS = frozenset({
+        'alias', 'bg', 'cd', 'eval', 'exec', 'exit', 'export', 'fg', 'jobs',
+        'read', 'set', 'source', 'type', 'ulimit', 'umask', 'unalias', 'unset', 'wait', '.',
+    })
+
     def __init__(self, encoding: str = 'utf-8'):
         self.encoding = encoding
         self.command_string: Optional[str] = None
         self.cwd: Optional[str] = None
         self.shell: bool = True
-        self._result: Optional[subprocess.CompletedProcess] = None
+        self.capture: bool = True
+        self._returncode: Optional[int] = None
+        self._stdout: Optional[str] = None
+        self._stderr: Optional[str] = None
         self._executed = False
 
-    def reset(self, command_string: str, cwd: Optional[str], shell: bool = True) -> 'CommandExecutor':
-        """用新命令的配置重置执行器。"""
+    def reset(self, command_string: str, cwd: Optional[str], shell: bool = True,
+              capture: bool = True) -> 'CommandExecutor':
+        """
+        用新命令的配置重置执行器。
+
+        capture 为 False 时非流式执行的 stdout 直接重定向到 /dev/null，结果中的 stdout 为空字符串；
+        stderr 仍会收集，以便报告失败原因。
+        """
         self.command_string = command_string
         self.cwd = cwd
         self.shell = shell
-        self._result = None
+        self.capture = capture
+        self._returncode = self._stdout = self._stderr = None
         self._executed = False
         return self
 
+    def _build_args(self):
+        """
+        简单命令直接拆分成参数列表并以 shell=False 执行，省去一次 /bin/sh 的 fork/exec。
+        返回 (args, shell)。
+        """
+        if not self.shell or _IS_WINDOWS:
+            return self.command_string, self.shell
+        if self._NEEDS_SHELL.search(self.command_string):
+            return self.command_string, True
+        try:
+            args = shlex.split(self.command_string)
+        except ValueError:
+            return self.command_string, True
+        # 不在 PATH 中的命令名多半是 shell 内建命令（command、hash、: 等），交给 shell 执行
+        if not args or args[0] in self._SHELL_BUILTINS or _which(args[0]) is None:
+            return self.command_string, True
+        return args, False
+
     def run(self, stream_output: bool = False) -> 'CommandExecutor':
         """执行已配置的命令。"""
         if not self.command_string:
             raise RuntimeError("Executor not configured. Call reset() before run().")
         
         try:
+            args, shell = self._build_args()
             if stream_output:
-                self._run_streaming()
+                self._run_streaming(args, shell)
             else:
-                self._run_blocking()
+                self._run_blocking(args, shell)
         except FileNotFoundError:
             stderr = f"Command not found: {self.command_string.split()[0]}"
-            self._result = subprocess.CompletedProcess(self.command_string, -1, stderr=stderr)
+            self._set_result(-1, None, stderr)
         except Exception as e:
-            self._result = subprocess.CompletedProcess(self.command_string, -2, stderr=str(e))
+            self._set_result(-2, None, str(e))
         
         self._executed = True
         return self
 
-    def _stream_reader(self, stream, output_lines: list, prefix: str):
-        """实时读取流并存储输出。"""
-        for line in iter(stream.readline, ''):
-            print(f"{prefix} {line.strip()}", flush=True)
-            output_lines.append(line)
+    def run_in(self, shell: 'PersistentShell') -> 'CommandExecutor':
+        """在给定的常驻 shell 中执行已配置的命令。"""
+        if not self.command_string:
+            raise RuntimeError("Executor not configured. Call reset() before run().")
+
+        returncode, stdout, stderr = shell.run(self.command_string, self.cwd, self.capture)
+        return self.record(self.command_string, returncode, stdout, stderr)
+
+    def record(self, command_string: str, returncode: int, stdout: str = "", stderr: str = "") -> 'CommandExecutor':
+        """直接记录一条命令的结果（用于不经过子进程执行的命令）。"""
+        self.command_string = command_string
+        self._set_result(returncode, stdout, stderr)
+        self._executed = True
+        return self
+
+    def _set_result(self, returncode: int, stdout: Optional[str], stderr: Optional[str]):
+        self._returncode = returncode
+        self._stdout = stdout
+        self._stderr = stderr
+
+    @staticmethod
+    def _format_lines(block: bytes, prefix: bytes, out: bytearray):
+        """把一块完整的输出逐行加上前缀，追加到待写出的缓冲区。"""
+        for line in block.splitlines(keepends=True):
+            out += prefix
+            out += line
+        if not block.endswith(b'\n'):
+            out += b'\n'
+
+    def _flush_output(self, out: bytearray):
+        # sys.stdout 被替换（如 redirect_stdout 到 StringIO）时没有 buffer，退回到解码后写文本
+        buffer = getattr(sys.stdout, 'buffer', None)
+        if buffer is not None:
+            buffer.write(out)
+            buffer.flush()
+        else:
+            sys.stdout.write(out.decode(self.encoding, errors='replace'))
+            sys.stdout.flush()
+        out.clear()
+
+    def _stream_reader(self, stream, output_buf: bytearray, prefix: str):
+        """
+        实时读取流并存储输出（仅用于不支持 select 管道的 Windows）；
+        攒满 64 行或距上次写出超过 _FLUSH_INTERVAL 秒时写出一次，输出缓慢的命令逐行可见。
+        原始字节追加到 output_buf，只有打印时才逐行解码。
+        """
+        pending = []
+        # 第一行总是立即写出；readline 阻塞期间无法定时写出，其后的行最迟随下一行一起写出
+        last_flush = float('-inf')
+        for line in iter(stream.readline, b''):
+            output_buf += line
+            pending.append(f"{prefix} {line.decode(self.encoding, errors='replace')}")
+            now = time.monotonic()
+            if len(pending) >= 64 or now - last_flush >= self._FLUSH_INTERVAL:
+                self._write_pending(pending)
+                last_flush = now
+        if pending:
+            if not pending[-1].endswith('\n'):
+                pending[-1] += '\n'
+            self._write_pending(pending)
         stream.close()
 
-    def _run_streaming(self):
+    @staticmethod
+    def _write_pending(pending: list):
+        sys.stdout.write("".join(pending))
+        sys.stdout.flush()
+        pending.clear()
+
+    def _run_streaming(self, args, shell: bool):
         """以流式方式执行命令，实时打印输出。"""
+        if _IS_WINDOWS:
+            self._run_streaming_threaded(args, shell)
+            return
+
+        process = subprocess.Popen(
+            args, shell=shell, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, cwd=self.cwd, close_fds=self._CLOSE_FDS
+        )
+        try:
+            self._stream_process(process)
+        except BaseException:
+            # 流式读取中途出错（包括 KeyboardInterrupt）时不留下未回收的子进程
+            process.kill()
+            process.wait()
+            raise
+
+    def _stream_process(self, process: subprocess.Popen):
+        """读取并实时打印子进程的输出，结束后记录结果。"""
+        stdout_buf, stderr_buf = bytearray(), bytearray()
+        # 之后优先直接写 sys.stdout.buffer，先把文本层里已缓冲的内容刷出去以保证顺序
+        sys.stdout.flush()
+        # 在当前线程里用 selector 同时等待 stdout/stderr，不再为每条命令创建两个线程。
+        # 原始字节直接追加到 bytearray，结束时只解码一次；按行拆分只用于打印。
+        # 打印内容先攒在 pending 中，每隔 _FLUSH_INTERVAL 秒或超过 _FLUSH_BYTES 才写出一次。
+        pending = bytearray()
+        last_flush = time.monotonic()
+        with selectors.DefaultSelector() as sel:
+            # data: [缓冲区, 打印前缀, 已打印到的偏移]
+            sel.register(process.stdout, selectors.EVENT_READ, [stdout_buf, b"[stdout] ", 0])
+            sel.register(process.stderr, selectors.EVENT_READ, [stderr_buf, b"[stderr] ", 0])
+            while sel.get_map():
+                timeout = None
+                if pending:
+                    timeout = max(0.0, last_flush + self._FLUSH_INTERVAL - time.monotonic())
+                events = sel.select(timeout)
+                if pending and (len(pending) >= self._FLUSH_BYTES
+                                or time.monotonic() - last_flush >= self._FLUSH_INTERVAL):
+                    self._flush_output(pending)
+                    last_flush = time.monotonic()
+                for key, _ in events:
+                    buf, prefix, start = key.data
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        buf.extend(chunk)
+                        end = buf.rfind(b'\n', start) + 1
+                        if not end:
+                            continue
+                    else:
+                        end = len(buf)
+                        sel.unregister(key.fileobj)
+                        key.fileobj.close()
+                    key.data[2] = end
+                    if end > start:
+                        self._format_lines(bytes(buf[start:end]), prefix, pending)
+        if pending:
+            self._flush_output(pending)
+        process.wait()
+
+        self._set_result(
+            process.returncode,
+            stdout_buf.decode(self.encoding, errors='replace'),
+            stderr_buf.decode(self.encoding, errors='replace'),
+        )
+
+    def _run_streaming_threaded(self, args, shell: bool):
         process = subprocess.Popen(
-            self.command_string, shell=self.shell, stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, text=True, encoding=self.encoding, cwd=self.cwd
+            args, shell=shell, stdout=subprocess.PIPE, 
+            stderr=subprocess.PIPE, cwd=self.cwd
         )
-        stdout_lines, stderr_lines = [], []
-        thread_stdout = threading.Thread(target=self._stream_reader, args=(process.stdout, stdout_lines, "[stdout]"))
-        thread_stderr = threading.Thread(target=self._stream_reader, args=(process.stderr, stderr_lines, "[stderr]"))
+        stdout_buf, stderr_buf = bytearray(), bytearray()
+        thread_stdout = threading.Thread(target=self._stream_reader, args=(process.stdout, stdout_buf, "[stdout]"))
+        thread_stderr = threading.Thread(target=self._stream_reader, args=(process.stderr, stderr_buf, "[stderr]"))
         
         thread_stdout.start()
         thread_stderr.start()
@@ -70,16 +264,78 @@ class CommandExecutor:
         thread_stderr.join()
         process.wait()
 
-        self._result = subprocess.CompletedProcess(
-            process.args, process.returncode,
-            stdout="".join(stdout_lines), stderr="".join(stderr_lines)
-        )
+        self._set_result(process.returncode, self._decode_text(stdout_buf), self._decode_text(stderr_buf))
+
+    def _decode_text(self, data: bytearray) -> str:
+        """一次性解码，并像文本模式管道那样统一换行符。"""
+        return data.decode(self.encoding, errors='replace').replace('\r\n', '\n').replace('\r', '\n')
 
-    def _run_blocking(self):
+    def _run_blocking(self, args, shell: bool):
         """以阻塞方式执行命令，一次性获取所有输出。"""
-        self._result = subprocess.run(
-            self.command_string, shell=self.shell, capture_output=True,
-            text=True, encoding=self.encoding, cwd=self.cwd
+        if not shell and hasattr(os, 'posix_spawn') and self._same_cwd():
+            self._run_spawn(args)
+            return
+        result = subprocess.run(
+            args, shell=shell, cwd=self.cwd, close_fds=self._CLOSE_FDS,
+            stdout=subprocess.PIPE if self.capture else subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        self._set_result(
+            result.returncode,
+            result.stdout.decode(self.encoding, errors='replace') if self.capture else "",
+            result.stderr.decode(self.encoding, errors='replace'),
+        )
+
+    def _same_cwd(self) -> bool:
+        # os.posix_spawn 无法为子进程切换目录，只有工作目录与本进程一致时才能走这条路径
+        return self.cwd is None or self.cwd == os.getcwd()
+
+    def _run_spawn(self, argv: List[str]):
+        """
+        用 os.posix_spawn 直接启动程序，不 fork 当前 Python 进程。
+
+        只服务于直接调用 `CommandExecutor.run()` 的场景；TerminalSession 的非流式执行
+        走常驻 shell（run_in），不会经过这里。
+        """
+        path = argv[0] if os.sep in argv[0] else _which(argv[0])
+        if path is None:
+            raise FileNotFoundError(argv[0])
+
+        # 不需要 stdout 时让子进程直接打开 /dev/null，内核丢弃输出，省去管道和读取
+        pipes = {2: os.pipe2(os.O_CLOEXEC)}
+        if self.capture:
+            pipes[1] = os.pipe2(os.O_CLOEXEC)
+        file_actions = [(os.POSIX_SPAWN_DUP2, w, target) for target, (_, w) in pipes.items()]
+        if not self.capture:
+            file_actions.append((os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0))
+        try:
+            pid = os.posix_spawn(path, argv, os.environ, file_actions=file_actions)
+        except BaseException:
+            # 启动失败时没有人再读取管道，读端也要一并关闭
+            for r, _ in pipes.values():
+                os.close(r)
+            raise
+        finally:
+            for _, w in pipes.values():
+                os.close(w)
+
+        outputs = {r: bytearray() for r, _ in pipes.values()}
+        with selectors.DefaultSelector() as sel:
+            for fd in outputs:
+                sel.register(fd, selectors.EVENT_READ)
+            while sel.get_map():
+                for key, _ in sel.select():
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        outputs[key.fd].extend(chunk)
+                    else:
+                        sel.unregister(key.fd)
+                        os.close(key.fd)
+        _, status = os.waitpid(pid, 0)
+
+        self._set_result(
+            os.waitstatus_to_exitcode(status),
+            outputs[pipes[1][0]].decode(self.encoding, errors='replace') if self.capture else "",
+            outputs[pipes[2][0]].decode(self.encoding, errors='replace'),
         )
 
     def _check_if_executed(self):
@@ -89,52 +345,208 @@ class CommandExecutor:
     @property
     def returncode(self) -> int:
         self._check_if_executed()
-        return self._result.returncode
+        return self._returncode
 
     @property
     def stdout(self) -> str:
         self._check_if_executed()
-        return self._result.stdout
+        return self._stdout
 
     @property
     def stderr(self) -> str:
         self._check_if_executed()
-        return self._result.stderr
+        return self._stderr
 
     @property
     def success(self) -> bool:
         self._check_if_executed()
         return self.returncode == 0
 
+class PersistentShell:
+    """
+    常驻的 bash 进程，批量执行时复用同一个 shell，省去每条命令的 fork/exec。
+
+    每条命令后追加一个哨兵行来标记结束并带回退出码；stderr 由后台线程读取。
+    整个会话只使用这一组 stdin/stdout/stderr 管道和两块可复用的读缓冲区，
+    不再为每条命令新建管道。
+
+    命令经 `eval` 执行，不完整的输入（未闭合的引号、结尾的 `\\`、未结束的 heredoc）
+    只会让这一条命令报语法错误，不会吞掉后面的哨兵行；
+    超过 timeout 秒仍未结束的命令会连同 shell 一起被杀掉，shell 随后重启。
+
+    所有命令共用同一个 shell，除工作目录外的状态都会带到后续命令：
+    `export` 的变量、`set -e` 等选项、`trap`、函数与 `ulimit`/`umask` 等。
+    包装脚本只用 `builtin cd`/`builtin eval`/`builtin printf`，
+    用户定义的同名函数不会破坏哨兵与目录切换。
+    """
+    _SENTINEL = '__TERMINAL_SESSION_DONE__'
+    DEFAULT_TIMEOUT = 600.0
+    # stdout 关闭后等待 shell 自行退出的秒数，超过则视为 shell 仍在运行
+    _EXIT_GRACE = 1.0
+
+    def __init__(self, encoding: str = 'utf-8', timeout: Optional[float] = DEFAULT_TIMEOUT):
+        self.encoding = encoding
+        self.timeout = timeout
+        self._sentinel = self._SENTINEL.encode()
+        self.proc: Optional[subprocess.Popen] = None
+        self._start()
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            ['bash', '--noprofile', '--norc'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, bufsize=0, start_new_session=True
+        )
+        self._stdout_buf = bytearray()
+        self._stderr_output = b""
+        self._stderr_done = threading.Event()
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, args=(self.proc,), daemon=True)
+        self._stderr_thread.start()
+
+    def _read_until_sentinel(self, fd: int, buf: bytearray,
+                             deadline: Optional[float] = None) -> Optional[Tuple[bytes, bytes]]:
+        """
+        从 fd 分块读取到哨兵行为止。
+        返回 (哨兵之前的内容, 哨兵行剩余部分)，并把它们从 buf 中移除；遇到 EOF 返回 None。
+        给出 deadline（time.monotonic() 时刻）时，到期仍未读到哨兵则抛出 TimeoutError。
+        """
+        search_from = 0
+        while True:
+            index = buf.find(self._sentinel, search_from)
+            if index >= 0:
+                end = buf.find(b'\n', index)
+                if end >= 0:
+                    payload = bytes(buf[:index])
+                    tail = bytes(buf[index + len(self._sentinel):end])
+                    del buf[:end + 1]
+                    return payload, tail
+            else:
+                search_from = max(0, len(buf) - len(self._sentinel) + 1)
+            if deadline is not None:
+                ready, _, _ = select.select([fd], [], [], max(0.0, deadline - time.monotonic()))
+                if not ready:
+                    raise TimeoutError
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return None
+            buf.extend(chunk)
+
+    def _drain_stderr(self, proc: subprocess.Popen):
+        """持续读取 stderr，遇到哨兵时通知当前命令的 stderr 已读完。"""
+        buf = bytearray()
+        fd = proc.stderr.fileno()
+        while True:
+            result = self._read_until_sentinel(fd, buf)
+            if result is None:
+                self._stderr_output = bytes(buf)
+                self._stderr_done.set()
+                return
+            self._stderr_output = result[0]
+            self._stderr_done.set()
+
+    def run(self, command_string: str, cwd: str, capture: bool = True) -> Tuple[int, str, str]:
+        """在常驻 shell 中执行一条命令，返回 (退出码, stdout, stderr)；capture 为 False 时丢弃 stdout。"""
+        if self.proc.poll() is not None:
+            self._start()
+        self._stderr_done.clear()
+
+        redirect = '' if capture else ' > /dev/null'
+        script = (
+            f"builtin cd -- {shlex.quote(cwd)} && builtin eval -- {shlex.quote(command_string)} < /dev/null{redirect}\n"
+            f"builtin printf '%s%d\\n' {self._SENTINEL} $?\n"
+            f"builtin printf '%s\\n' {self._SENTINEL} >&2\n"
+        )
+        try:
+            self.proc.stdin.write(script.encode(self.encoding))
+        except BrokenPipeError:
+            self._start()
+            return -2, "", "Persistent shell exited unexpectedly"
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        try:
+            result = self._read_until_sentinel(self.proc.stdout.fileno(), self._stdout_buf, deadline)
+        except TimeoutError:
+            self._kill()
+            self._stderr_done.wait()
+            stdout = bytes(self._stdout_buf).decode(self.encoding, errors='replace')
+            self._start()
+            return -1, stdout, f"Command timed out after {self.timeout:g}s"
+
+        if result is not None:
+            self._stderr_done.wait()
+            stdout = result[0].decode(self.encoding, errors='replace')
+            stderr = self._stderr_output.decode(self.encoding, errors='replace')
+            return int(result[1]), stdout, stderr
+
+        # stdout 到达 EOF：命令让 shell 退出了（例如 `exit`），沿用其退出码；
+        # 也可能只是关闭或重定向了 shell 的 stdout（例如 `exec 1>file`），
+        # 这时 shell 还活着并等待输入，再也取不回哨兵，只能杀掉重启
+        try:
+            returncode = self.proc.wait(timeout=self._EXIT_GRACE)
+        except subprocess.TimeoutExpired:
+            self._kill()
+            returncode = -1
+        self._stderr_done.wait()
+        stdout = bytes(self._stdout_buf).decode(self.encoding, errors='replace')
+        stderr = self._stderr_output.decode(self.encoding, errors='replace')
+        if returncode == -1:
+            stderr += "Persistent shell stdout was closed; shell restarted\n"
+        self._start()
+        return returncode, stdout, stderr
+
+    def _kill(self):
+        """杀掉整个进程组，避免后台子进程继续占着管道。"""
+        os.killpg(self.proc.pid, signal.SIGKILL)
+        self.proc.wait()
+
+    def close(self):
+        """关闭 shell 进程。"""
+        if self.proc and self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+
 class TerminalSession:
     """
     模拟一个带状态的终端会话，支持交互式、单个及批量命令执行。
     
     通过持有一个可复用的 `CommandExecutor` 实例来优化批量任务性能。
     """
+    # 可以在进程内完成的简单文件操作（路径不含空白、引号、通配符等 shell 语法）
+    _PATH = r"([\w./+@%:,][\w./+@%:,=-]*)"
+    _ECHO_REDIRECT = re.compile(r"echo\s+'([^']*)'\s*(>>?)\s*" + _PATH)
+    _FILE_OP = re.compile(r"(rm|del|mkdir|rmdir)\s+" + _PATH)
+    # 按命令名分派到对应的快速路径：POSIX 上是 echo 重定向与 rm，Windows 上是 del，两者都有 mkdir/rmdir
+    _FAST_PATHS = dict(
+        {'del': _FILE_OP} if _IS_WINDOWS else {'echo': _ECHO_REDIRECT, 'rm': _FILE_OP},
+        mkdir=_FILE_OP, rmdir=_FILE_OP,
+    )
+
+    # 批量分组执行时每完成一步写到 stderr 的标记，后接已完成的步数
+    _STEP_MARKER = '__TERMINAL_SESSION_STEP__'
+
     def __init__(self, start_dir: Optional[str] = None):
         self.cwd = os.path.abspath(start_dir or os.getcwd())
         self._executor = CommandExecutor()
+        self._shell: Optional[PersistentShell] = None
         print(f"终端会话已启动，当前目录: {self.cwd}")
 
     @property
     def prompt(self) -> str:
         """生成一个类似终端的提示符。"""
         display_path = self.cwd
-        if platform.system() != "Windows":
-            home_dir = os.path.expanduser("~")
-            if self.cwd.startswith(home_dir):
-                display_path = f"~{self.cwd[len(home_dir):]}"
+        if not _IS_WINDOWS and self.cwd.startswith(_HOME):
+            display_path = f"~{self.cwd[len(_HOME):]}"
         return f"{display_path} $ "
         
     def _handle_cd(self, target_dir: str) -> bool:
         """内部处理 'cd' 命令，改变会话的当前工作目录。"""
         if not target_dir or target_dir == '~':
-            target_dir = os.path.expanduser('~')
+            target_dir = _HOME
         elif target_dir.startswith('~/'):
-            target_dir = os.path.expanduser(target_dir)
+            target_dir = _HOME + target_dir[1:]
 
-        new_path = os.path.abspath(os.path.join(self.cwd, target_dir))
+        # self.cwd 已是绝对路径，纯字符串规范化即可，无需 abspath 再调用 getcwd
+        new_path = os.path.normpath(target_dir if os.path.isabs(target_dir) else os.path.join(self.cwd, target_dir))
         
         if os.path.isdir(new_path):
             self.cwd = new_path
@@ -144,24 +556,49 @@ class TerminalSession:
         print(f"cd: no such file or directory: {original_target}")
         return False
 
-    def execute(self, command_string: str, stream_output: bool = True, verbose: bool = True) -> bool:
+    @property
+    def shell(self) -> PersistentShell:
+        """按需创建的常驻 shell，供批量执行复用。"""
+        if self._shell is None:
+            self._shell = PersistentShell(self._executor.encoding)
+        return self._shell
+
+    def close(self):
+        """释放常驻 shell。"""
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
+
+    def execute(self, command_string: str, stream_output: bool = True, verbose: bool = True,
+                capture: bool = True) -> bool:
         """
         在当前会话中执行单个命令。
         
         特殊处理 'cd' 命令，其余命令委托给内部执行器。
+        capture 为 False 时不保留非流式执行的 stdout。
         返回命令是否成功。
         """
         command_string = command_string.strip()
         if not command_string: return True
         if verbose: print(f"--- [执行]: {command_string} ---")
         
-        if command_string.startswith("cd "):
-            success = self._handle_cd(command_string[3:].strip())
-        elif command_string.lower() == 'pwd':
+        head, sep, tail = command_string.partition(' ')
+        if head == 'cd' and sep:
+            success = self._handle_cd(tail.strip())
+        elif not sep and head.lower() == 'pwd':
             print(self.cwd)
             success = True
+        elif (fast_path := self._match_fast_path(command_string, head)) is not None:
+            success = self._run_fast_path(fast_path)
+            if not success:
+                print(self._executor.stderr)
         else:
-            self._executor.reset(command_string, self.cwd).run(stream_output)
+            self._executor.reset(command_string, self.cwd, capture=capture)
+            if stream_output or _IS_WINDOWS:
+                self._executor.run(stream_output)
+            else:
+                # 不需要实时输出时交给常驻 shell 执行，单条命令也省去一次 fork/exec
+                self._executor.run_in(self.shell)
             success = self._executor.success
             if not success and not stream_output and self._executor.stderr:
                 print(self._executor.stderr.strip())
@@ -169,32 +606,222 @@ class TerminalSession:
         if verbose: print(f"--- [结束 (成功: {success})] ---")
         return success
 
-    def execute_batch(self, commands: List[str], stream_output: bool = False, verbose: bool = True) -> bool:
+    def execute_batch(self, commands: List[str], stream_output: bool = False, verbose: bool = True,
+                      parallelism: int = 1) -> bool:
         """
         按顺序执行命令列表，任何命令失败则立即中断。
         
         :param commands: 要执行的命令字符串列表。
         :param stream_output: 是否实时打印每个子命令的输出。
         :param verbose: 是否打印详细的步骤信息和最终摘要。
+        :param parallelism: 大于 1 时并发执行（要求命令互相独立）；首个失败会取消其余命令。
+                            列表中含 cd/pwd 或需要流式输出时仍按顺序执行。
         :return: 所有命令是否都成功执行。
         """
+        if (parallelism > 1 and not stream_output
+                and not any(self._changes_session_state(command) for command in commands)):
+            return self.execute_parallel(commands, parallelism, verbose, fail_fast=True)
+
         if verbose: print(f"\n--- [开始批量执行 {len(commands)} 条命令] ---")
+        total = len(commands)
+        grouping = not stream_output and not _IS_WINDOWS
+        # 静默且非流式时没有人读取各命令的 stdout，让它直接进 /dev/null
+        capture = verbose or stream_output
         
-        for i, command in enumerate(commands):
-            if verbose: print(f"\n[步骤 {i+1}/{len(commands)}] > {command}")
+        i = 0
+        while i < total:
+            if grouping and not self._is_session_builtin(commands[i]):
+                # 把连续的外部命令用 && 串成一组，一次发给常驻 shell
+                end = i
+                while end < total and not self._is_session_builtin(commands[end]):
+                    end += 1
+                if verbose:
+                    for k in range(i, end):
+                        print(f"\n[步骤 {k+1}/{total}] > {commands[k]}")
+                failed_at = self._execute_group(commands[i:end], capture)
+                if failed_at is not None:
+                    return self._report_batch_failure(i + failed_at, commands[i + failed_at])
+                i = end
+                continue
+
+            command = commands[i]
+            if verbose: print(f"\n[步骤 {i+1}/{total}] > {command}")
             
-            success = self.execute(command, stream_output, verbose=False)
+            success = self.execute(command, stream_output, verbose=False, capture=capture)
             
             if not success:
-                print(f"\n[!!] 批量执行失败于步骤 {i+1}: '{command}'")
-                if self._executor._executed and self._executor.stderr:
-                    print("错误详情:", self._executor.stderr.strip())
-                print("--- [批量执行已终止] ---")
-                return False
+                return self._report_batch_failure(i, command)
+            i += 1
         
         if verbose: print("\n--- [批量执行成功] 所有命令均已成功。 ---")
         return True
 
+    def execute_script(self, script: str, verbose: bool = True) -> bool:
+        """
+        把整段脚本交给一个 bash 进程执行：一次 fork/exec，循环在 shell 内完成。
+
+        适合纯 shell 的批量任务，比逐条 `execute_batch` 快几个数量级；
+        但没有逐步回调，脚本里的 cd 也不会改变会话的当前目录。
+        脚本先写入临时文件再由 bash 读取，标准输入接 /dev/null，
+        脚本中读取标准输入的命令不会吞掉后面的脚本内容。
+        输出直接打印到终端，返回脚本的退出码是否为 0。
+        """
+        if verbose: print("\n--- [开始执行脚本] ---")
+        with tempfile.NamedTemporaryFile('wb', suffix='.sh') as script_file:
+            script_file.write(script.encode(self._executor.encoding))
+            script_file.flush()
+            try:
+                returncode = subprocess.call(['bash', script_file.name], stdin=subprocess.DEVNULL, cwd=self.cwd)
+            except FileNotFoundError:
+                print("Command not found: bash")
+                return False
+        success = returncode == 0
+        if verbose: print(f"--- [脚本结束 (成功: {success})] ---")
+        return success
+
+    def execute_parallel(self, commands: List[str], max_concurrency: Optional[int] = None,
+                         verbose: bool = True, fail_fast: bool = False) -> bool:
+        """
+        并发执行一组互相独立的命令，用并发掩盖每条命令的 fork/exec 延迟。
+
+        调用方需保证命令之间没有依赖（不能含 cd，也不能读写同一个文件）；
+        不保证执行顺序。`fail_fast` 为 True 时，首个失败会终止其余尚未完成的命令。
+        :return: 所有命令是否都成功执行。
+        """
+        if any(command.strip().startswith("cd ") for command in commands):
+            raise ValueError("execute_parallel 不支持 cd，请改用 execute_batch")
+        limit = max_concurrency or (os.cpu_count() or 1) * 2
+        if verbose: print(f"\n--- [开始并发执行 {len(commands)} 条命令 (并发数 {limit})] ---")
+
+        returncodes = asyncio.run(self._gather_commands(commands, limit, fail_fast))
+
+        failed = [(i, code) for i, code in enumerate(returncodes) if code not in (0, None)]
+        for i, code in failed:
+            print(f"[!!] 步骤 {i+1} 失败 (退出码 {code}): '{commands[i]}'")
+        if failed and fail_fast:
+            print("--- [并发执行已终止] ---")
+            return False
+        if verbose: print(f"--- [并发执行结束] 成功 {len(commands) - len(failed)}/{len(commands)} ---")
+        return not failed
+
+    async def _gather_commands(self, commands: List[str], limit: int,
+                               fail_fast: bool = False) -> List[Optional[int]]:
+        """并发运行命令，返回与 commands 一一对应的退出码；因 fail_fast 被跳过或终止的命令为 None。"""
+        semaphore = asyncio.Semaphore(limit)
+        running = set()
+        stopped = False
+
+        def kill(process):
+            try:
+                if _IS_WINDOWS:
+                    process.kill()
+                else:
+                    os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass  # 进程已自行退出
+
+        async def run_one(command: str) -> Optional[int]:
+            nonlocal stopped
+            async with semaphore:
+                if stopped:
+                    return None
+                # 放入独立的进程组，终止时连同 shell 启动的子进程一起结束
+                process = await asyncio.create_subprocess_shell(
+                    command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=self.cwd,
+                    start_new_session=not _IS_WINDOWS
+                )
+                running.add(process)
+                try:
+                    _, stderr = await process.communicate()
+                finally:
+                    running.discard(process)
+                if process.returncode == 0:
+                    return 0
+                if stopped:
+                    return None  # 被其他命令的失败终止
+                if stderr:
+                    print(stderr.decode(self._executor.encoding, errors='replace').strip())
+                if fail_fast:
+                    stopped = True
+                    for other in running:
+                        kill(other)
+                return process.returncode
+
+        return await asyncio.gather(*(run_one(command) for command in commands))
+
+    def _changes_session_state(self, command: str) -> bool:
+        """会改变或读取会话状态（cd/pwd）的命令，不能与其他命令并发。"""
+        head, sep, _ = command.strip().partition(' ')
+        return (head == 'cd' and sep == ' ') or (not sep and head.lower() == 'pwd')
+
+    def _is_session_builtin(self, command: str) -> bool:
+        """会话自身处理（或需要单独处理）的命令，不能并入 && 分组。"""
+        command = command.strip()
+        return (not command or self._changes_session_state(command)
+                or self._match_fast_path(command, command.partition(' ')[0]) is not None)
+
+    def _match_fast_path(self, command_string: str, head: str) -> Optional[re.Match]:
+        """按命令名查表，判断命令能否在进程内完成。"""
+        pattern = self._FAST_PATHS.get(head)
+        return pattern.fullmatch(command_string) if pattern else None
+
+    def _run_fast_path(self, m: re.Match) -> bool:
+        """在进程内执行已匹配的文件操作，省去一次子进程创建。"""
+        command_string = m[0]
+        name = command_string.split(None, 1)[0]
+        path = os.path.join(self.cwd, m.group(m.lastindex))
+        try:
+            if name == 'echo':
+                with open(path, 'a' if m[2] == '>>' else 'w', encoding=self._executor.encoding) as f:
+                    f.write(m[1] + '\n')
+            elif name in ('rm', 'del'):
+                os.remove(path)
+            elif name == 'mkdir':
+                os.mkdir(path)
+            else:
+                os.rmdir(path)
+        except OSError as e:
+            self._executor.record(command_string, 1, stderr=f"{name}: {m.group(m.lastindex)}: {e.strerror}")
+            return False
+        self._executor.record(command_string, 0)
+        return True
+
+    def _execute_group(self, group: List[str], capture: bool = True) -> Optional[int]:
+        """
+        在常驻 shell 中以 `cmd1 && cmd2 && ...` 的形式执行一组命令。
+
+        每条命令前都重新 `cd` 回会话目录，组内某条命令里的 cd 不会影响后面的命令，
+        与逐条执行的行为一致。
+        每完成一步就向 stderr 写一行步骤标记，失败时由最后一个标记定位失败的步骤；
+        标记随本组的输出一起返回，即使命令让 shell 退出（如 `exit`）也不会丢失。
+        返回失败命令在组内的下标，全部成功则返回 None。
+        """
+        cd = f"builtin cd -- {shlex.quote(self.cwd)}"
+        script = " && ".join(
+            f"{cd} && builtin eval -- {shlex.quote(command)} && builtin printf '%s%d\\n' {self._STEP_MARKER} {k+1} >&2"
+            for k, command in enumerate(group)
+        )
+        executor = self._executor.reset(script, self.cwd, capture=capture).run_in(self.shell)
+        # 去掉 stderr 中的步骤标记，只把命令自己的输出留给失败报告
+        completed = 0
+        stderr_lines = []
+        for line in executor.stderr.splitlines(keepends=True):
+            if line.startswith(self._STEP_MARKER):
+                completed = int(line[len(self._STEP_MARKER):])
+            else:
+                stderr_lines.append(line)
+        executor.record(script, executor.returncode, executor.stdout, ''.join(stderr_lines))
+        if executor.success:
+            return None
+        return min(completed, len(group) - 1)
+
+    def _report_batch_failure(self, index: int, command: str) -> bool:
+        print(f"\n[!!] 批量执行失败于步骤 {index+1}: '{command}'")
+        if self._executor._executed and self._executor.stderr:
+            print("错误详情:", self._executor.stderr.strip())
+        print("--- [批量执行已终止] ---")
+        return False
+
     def run_interactive(self):
         """启动一个交互式循环，模拟真实终端。"""
         while True:
@@ -205,6 +832,7 @@ class TerminalSession:
             except KeyboardInterrupt:
                 print() # 换行
                 break
+        self.close()
         print("终端会话结束。")
 
 if __name__ == "__main__":
@@ -1,11 +1,50 @@
 import re
+from functools import lru_cache
 
+try:
+    # google-re2 编译为 DFA，匹配时间与输入长度呈线性关系，不会出现回溯爆炸
+    import re2 as _regex_engine
+except ImportError:
+    _regex_engine = re
+
+@lru_cache(maxsize=None)
 def _word_to_regex(word: str) -> str:
     """
     将一个单词转换为一个正则表达式模式，该模式允许字符之间存在任意的空白（包括换行符）。
     """
     return r'\s*'.join(re.escape(c) for c in word)
 
+# 定义标记命令的模式
+_COMMAND_PART = (
+    r';'
+    r'\s*' + _word_to_regex('echo') + r'\s*'
+    r'"\s*' + _word_to_regex('TMUX_CMD_EXIT_CODE_') + r'.*?'
+    + re.escape(':$?') +
+    r'"'
+    r'\s*;\s*'
+    r'\s*' + _word_to_regex('tmux') + r'\s*'
+    r'\s*' + _word_to_regex('wait-for') + r'\s*'
+    r'-S\s*".*?"'
+)
+
+# 定义标记输出的模式 (必须在行首)
+_OUTPUT_PART = (
+    r'^\s*'
+    + _word_to_regex('TMUX_CMD_EXIT_CODE_')
+    + r'.*?'
+    + r':'
+    + r'[\s\d]*'
+)
+
+# 构建原子块模式，包含三个捕获组；在模块加载时编译一次
+# 使用内联标志 (?sm) 代替 re.DOTALL | re.MULTILINE，以同时兼容 re 与 re2
+_ATOMIC_BLOCK_RE = _regex_engine.compile(
+    f"(?sm)"
+    f"({_COMMAND_PART})"  # 组 1: 标记命令
+    f"(.*?)"              # 组 2: 真实输出 (我们想保留的内容)
+    f"({_OUTPUT_PART})"   # 组 3: 标记输出
+)
+
 def clean_output(lines_iter: list[str]) -> str:
     """
     清理Linux终端运行结果字符串，移除特定的标记命令及其输出。
@@ -22,38 +61,8 @@ def clean_output(lines_iter: list[str]) -> str:
 
     full_output = '\n'.join(lines_iter)
 
-    # 定义标记命令的模式
-    command_part = (
-        r';'
-        r'\s*' + _word_to_regex('echo') + r'\s*'
-        r'"\s*' + _word_to_regex('TMUX_CMD_EXIT_CODE_') + r'.*?'
-        + re.escape(':$?') +
-        r'"'
-        r'\s*;\s*'
-        r'\s*' + _word_to_regex('tmux') + r'\s*'
-        r'\s*' + _word_to_regex('wait-for') + r'\s*'
-        r'-S\s*".*?"'
-    )
-
-    # 定义标记输出的模式 (必须在行首)
-    output_part = (
-        r'^\s*'
-        + _word_to_regex('TMUX_CMD_EXIT_CODE_')
-        + r'.*?'
-        + r':'
-        + r'[\s\d]*'
-    )
-
-    # 构建原子块模式，包含三个捕获组
-    atomic_block_pattern = re.compile(
-        f"({command_part})"  # 组 1: 标记命令
-        f"(.*?)"             # 组 2: 真实输出 (我们想保留的内容)
-        f"({output_part})",  # 组 3: 标记输出
-        re.DOTALL | re.MULTILINE
-    )
-
     # 关键：使用回溯引用 r'\2' 替换整个区块，从而只保留真实输出
-    cleaned_text = atomic_block_pattern.sub(r'\2', full_output)
+    cleaned_text = _ATOMIC_BLOCK_RE.sub(r'\2', full_output)
     
     return cleaned_text.strip()
 
@@ -1,12 +1,18 @@
 import asyncio
+import codecs
 import os
 import pty
+import selectors
 import termios
+import threading
 from typing import Dict, List
 
+from rich.ansi import AnsiDecoder
 from rich.text import Text
 from textual.app import App, ComposeResult
 from textual.events import Key
+from textual.message import Message
+from textual.timer import Timer
 from textual.widgets import Header, Footer, RichLog
 
 # --- Configuration Constants ---
@@ -14,6 +20,24 @@ ESSENTIAL_VARS: List[str] = [
     "PATH", "HOME", "USER", "LOGNAME", "LANG", "LC_ALL", "LC_CTYPE"
 ]
 SHELL_PROMPT: str = r"\[\033[01;32m\]\w\[\033[00m\] \$ "
+PTY_READ_SIZE: int = 65536
+RENDER_INTERVAL: float = 1 / 60  # 每帧最多渲染一次 PTY 输出
+INPUT_FLUSH_INTERVAL: float = 0.005  # 按键在此时间窗口内合并为一次写入
+LOG_MAX_LINES: int = 10000  # 日志控件最多保留的行数，长时间运行时内存占用有上限
+# 沙箱环境在模块加载时构建一次，每次启动 shell 只需复制
+_BASE_ENV: Dict[str, str] = {
+    **{var: os.environ[var] for var in ESSENTIAL_VARS if var in os.environ},
+    "TERM": "xterm-256color",
+    "PS1": SHELL_PROMPT,
+}
+
+
+class PtyOutput(Message):
+    """PTY 读取线程读到的一整块输出；post_message 是线程安全的。"""
+
+    def __init__(self, data: bytes) -> None:
+        super().__init__()
+        self.data = data
 
 
 class PerfectTerminalApp(App):
@@ -30,7 +54,19 @@ class PerfectTerminalApp(App):
         self.shell_process: asyncio.subprocess.Process | None = None
         self.pty_master_fd: int | None = None
         self.original_termios: list | None = None
-        self.log_widget = RichLog(id="log", highlight=True, markup=True, wrap=True)
+        self.log_widget = RichLog(id="log", highlight=True, markup=True, wrap=True, max_lines=LOG_MAX_LINES)
+        self._pty_output = bytearray()
+        # 读取线程专用的缓冲区，每次读取都直接写入其中，不再为每块数据创建临时 bytes
+        self._read_buffer = memoryview(bytearray(PTY_READ_SIZE))
+        # 跨帧保留解码状态：被拆到两帧的多字节字符不会变成乱码，SGR 样式也能延续到下一帧
+        self._utf8_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._ansi_decoder = AnsiDecoder()
+        self._render_timer: Timer | None = None
+        self._render_task: asyncio.Task | None = None
+        self._pending_input: List[bytes] = []
+        self._input_timer: Timer | None = None
+        self._reader_thread: threading.Thread | None = None
+        self._reader_wakeup_fds: tuple[int, int] | None = None
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -46,6 +82,8 @@ class PerfectTerminalApp(App):
     async def _start_shell_in_pty(self):
         master_fd, slave_fd = pty.openpty()
         self.pty_master_fd = master_fd
+        # 非阻塞模式下可以在一次可读事件中把 PTY 读空
+        os.set_blocking(master_fd, False)
 
         self.original_termios = termios.tcgetattr(master_fd)
         attrs = termios.tcgetattr(master_fd)
@@ -67,27 +105,91 @@ class PerfectTerminalApp(App):
             env=sandboxed_env, start_new_session=True
         )
 
-        loop = asyncio.get_running_loop()
-        loop.add_reader(self.pty_master_fd, self._read_from_pty)
+        # 由独立线程等待 PTY 可读并读空，事件循环只在有整块数据时被唤醒
+        self._reader_wakeup_fds = os.pipe()
+        self._reader_thread = threading.Thread(
+            target=self._pty_reader_thread, name="pty-reader", daemon=True
+        )
+        self._reader_thread.start()
         os.close(slave_fd)
 
     def _create_sandboxed_environment(self) -> Dict[str, str]:
-        clean_env: Dict[str, str] = {}
-        for var in ESSENTIAL_VARS:
-            if var in os.environ:
-                clean_env[var] = os.environ[var]
-        clean_env["TERM"] = "xterm-256color"
-        clean_env["PS1"] = SHELL_PROMPT
-        return clean_env
-
-    def _read_from_pty(self) -> None:
+        return dict(_BASE_ENV)
+
+    def _pty_reader_thread(self) -> None:
+        """后台线程：用 selectors 等待 PTY 可读，读空后把整块数据交给事件循环。"""
+        wakeup_fd = self._reader_wakeup_fds[0]
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.pty_master_fd, selectors.EVENT_READ)
+            selector.register(wakeup_fd, selectors.EVENT_READ)
+            while True:
+                events = selector.select()
+                if any(key.fd == wakeup_fd for key, _ in events):
+                    return
+                data = self._read_from_pty()
+                if data:
+                    self.post_message(PtyOutput(data))
+                if data is None:
+                    return
+
+    def _read_from_pty(self) -> bytes | None:
+        """
+        读取 PTY 中的可用数据，最多填满一个缓冲区；shell 退出（EIO 等错误）时返回 None。
+
+        缓冲区满时剩余数据留给下一次可读事件，读取线程会立即再次进入这里。
+        """
+        view = self._read_buffer
+        total = 0
         try:
-            data = os.read(self.pty_master_fd, 1024)
-            if data:
-                rich_text = Text.from_ansi(data.decode('utf-8', errors='replace'))
-                self.log_widget.write(rich_text)
-        except OSError:
+            while total < len(view):
+                count = os.readv(self.pty_master_fd, [view[total:]])
+                if not count:
+                    break
+                total += count
+        except BlockingIOError:
             pass
+        except OSError:
+            return bytes(view[:total]) or None
+        return bytes(view[:total])
+
+    def on_pty_output(self, message: PtyOutput) -> None:
+        """暂存读到的输出，渲染推迟到下一帧统一进行。"""
+        self._pty_output += message.data
+        if self._render_timer is None:
+            self._render_timer = self.set_timer(RENDER_INTERVAL, self._flush_pty_output)
+
+    def _flush_pty_output(self) -> None:
+        """把一帧内累积的输出交给后台解析；同一时间只有一次解析在进行，保证输出顺序。"""
+        self._render_timer = None
+        if not self._pty_output or self._render_task is not None:
+            # 上一次解析完成后会再检查一次缓冲区，这里不必重复调度
+            return
+        data = bytes(self._pty_output)
+        self._pty_output.clear()
+        self._render_task = asyncio.create_task(self._render_pty_output(data))
+
+    async def _render_pty_output(self, data: bytes) -> None:
+        """在工作线程中解码并解析 ANSI 序列，事件循环只负责把结果写入日志控件。"""
+        try:
+            rich_text = await asyncio.to_thread(self._decode_pty_output, data)
+        finally:
+            self._render_task = None
+        if rich_text is not None:
+            self.log_widget.write(rich_text)
+        if self._pty_output and self._render_timer is None:
+            self._render_timer = self.set_timer(RENDER_INTERVAL, self._flush_pty_output)
+
+    def _decode_pty_output(self, data: bytes) -> Text | None:
+        """把原始字节转换为 Text；解码器带有跨帧状态，只能串行调用。"""
+        text = self._utf8_decoder.decode(data)
+        if not text:
+            return None
+        if '\x1b' not in text:
+            # 没有转义序列时跳过 ANSI 解析：与 AnsiDecoder 一样只保留每行最后一个回车之后的内容，
+            # 并沿用它当前的样式
+            plain = "\n".join(line.rpartition("\r")[2] for line in text.splitlines())
+            return Text(plain, style=self._ansi_decoder.style)
+        return Text("\n").join(self._ansi_decoder.decode(text))
 
     async def on_key(self, event: Key) -> None:
         """
@@ -96,15 +198,47 @@ class PerfectTerminalApp(App):
         """
         if self.pty_master_fd is not None:
             if event.key == "enter":
-                os.write(self.pty_master_fd, b'\r')
+                self._pending_input.append(b'\r')
             elif event.key == "backspace":
-                os.write(self.pty_master_fd, b'\x7f')
+                self._pending_input.append(b'\x7f')
             elif event.character:
-                os.write(self.pty_master_fd, event.character.encode('utf-8'))
+                self._pending_input.append(event.character.encode('utf-8'))
+            else:
+                return
+
+            if self._input_timer is None:
+                self._input_timer = self.set_timer(INPUT_FLUSH_INTERVAL, self._flush_input)
+
+    def _flush_input(self) -> None:
+        """用一次 writev 把缓冲的按键片段写入 PTY；写不下的部分留待下次刷新。"""
+        self._input_timer = None
+        if self.pty_master_fd is None or not self._pending_input:
+            return
+        try:
+            written = os.writev(self.pty_master_fd, self._pending_input)
+        except BlockingIOError:
+            written = 0
+
+        # 丢弃已完整写入的片段，并截掉部分写入片段的已写前缀
+        while written:
+            head = self._pending_input[0]
+            if written < len(head):
+                self._pending_input[0] = head[written:]
+                break
+            written -= len(head)
+            del self._pending_input[0]
+        if self._pending_input:
+            self._input_timer = self.set_timer(INPUT_FLUSH_INTERVAL, self._flush_input)
 
     async def action_quit(self) -> None:
+        if self._reader_thread:
+            os.write(self._reader_wakeup_fds[1], b'\0')
+            self._reader_thread.join()
+            for fd in self._reader_wakeup_fds:
+                os.close(fd)
+            self._reader_thread = None
+
         if self.pty_master_fd:
-            asyncio.get_running_loop().remove_reader(self.pty_master_fd)
             if self.original_termios:
                 termios.tcsetattr(self.pty_master_fd, termios.TCSADRAIN, self.original_termios)
             os.close(self.pty_master_fd)
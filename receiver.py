@@ -1,13 +1,16 @@
 import asyncio
-import json
 import traceback
 from typing import List, Union, Any
+import orjson
 from tmux_cmd_runner import TmuxTerminal, CommandResult
 from websocket_client import WebSocketClient
 
+# 固定的失败响应只需编码一次
+_FAILURE_PAYLOAD = orjson.dumps({"success": False})
+
 async def run_cmd_and_get_result(term: TmuxTerminal, cmd: Union[str, List[str]]) -> Any:
     """
-    在一个独立的线程中运行阻塞的命令并获取结果，以避免阻塞事件循环。
+    异步运行命令并获取结果；等待命令完成期间不会阻塞事件循环。
 
     Args:
         term: TmuxTerminal 实例。
@@ -29,8 +32,8 @@ async def run_cmd_and_get_result(term: TmuxTerminal, cmd: Union[str, List[str]])
         raise ValueError("命令列表不应为空!")
 
     try:
-        await asyncio.to_thread(term.execute, cmd)
-        result = await asyncio.to_thread(CommandResult.get)
+        await term.execute_async(cmd)
+        result = CommandResult.get()
         return result
 
     except Exception as e:
@@ -47,13 +50,13 @@ async def execute_and_log_task(term: TmuxTerminal, commands: Union[str, List[str
         # 等待在独立线程中运行的命令完成
         result = await run_cmd_and_get_result(term, commands)
         # print(f"命令 '{str(commands)[:50]}...' 的结果是:")
-        await wsc.send_message(sender_id, json.dumps({"success":True,"result":result}))
+        await wsc.send_message(sender_id, orjson.dumps({"success": True, "result": result}))
         print(result)
     except (TypeError, ValueError, RuntimeError) as e:
-        await wsc.send_message(sender_id, json.dumps({"success":False}))
+        await wsc.send_message(sender_id, _FAILURE_PAYLOAD)
         print(f"命令处理中出现错误: {e}")
     except Exception as e:
-        await wsc.send_message(sender_id, json.dumps({"success":False}))
+        await wsc.send_message(sender_id, _FAILURE_PAYLOAD)
         print(f"执行任务时发生未知错误: {e}")
         traceback.print_exc()
 
@@ -66,15 +69,15 @@ if __name__ == "__main__":
             它只负责解析消息并创建后台任务，永远不会被阻塞。
             """
             try:
-                msg_dict = json.loads(message)
+                msg_dict = orjson.loads(message)
                 commands = msg_dict['m']['data']
                 sender_id = msg_dict['s']
                 if term.is_running_cmd:
-                    await self.send_message(sender_id, json.dumps({"success":False}))
+                    await self.send_message(sender_id, _FAILURE_PAYLOAD)
                     print("正在运行中，请稍后传入命令")
                     return
                 asyncio.create_task(execute_and_log_task(term, commands, self, sender_id))
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 print("传入数据格式错误! 消息必须是有效的 JSON。")
             except KeyError:
                 print("出现 KeyError! JSON 结构应为 {'m': {'data': ...}}")
@@ -91,7 +94,13 @@ if __name__ == "__main__":
         try:
             # print("客户端启动，等待来自 ws://localhost:8765 的命令...")
             # print("注意: `asyncio.to_thread` 在 Python 3.9+ 中可用。")
-            asyncio.run(main())
+            # uvloop 仅支持 POSIX；未安装时（例如 Windows）使用标准事件循环
+            try:
+                import uvloop
+            except ImportError:
+                asyncio.run(main())
+            else:
+                uvloop.run(main())
         except KeyboardInterrupt:
             print("\n客户端关闭。")
         except RuntimeError as e:
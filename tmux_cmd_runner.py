@@ -1,28 +1,76 @@
+import asyncio
 import libtmux
 import os
 import re
-import time
-from functools import singledispatch
-from typing import Optional, List, Union, Tuple, Dict
+import shlex
+import subprocess
+import sys
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional, List, Union, Tuple, Dict, Deque, Callable
+
+# 回显到窗格中的标记行：每条命令的退出码，以及整批命令结束的信号。
+# 用户输入回显的那一行里紧跟着 `:$?"` 或 `"`，不会与这两个整行模式混淆。
+_EXIT_CODE_LINE = re.compile(r'TMUX_CMD_EXIT_CODE_(\d+):(\d+)\s*$')
+_BATCH_DONE_LINE = re.compile(r'TMUX_CMD_DONE_(\d+)\s*$')
+_OCTAL_ESCAPE = re.compile(rb'\\([0-7]{3})')
+# 原始窗格输出中的 CSI 控制序列（例如 readline 在回车后输出的 ESC[?2004l）
+_ANSI_CSI = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]')
+
+# capture_clean_output 使用的模式，在模块加载时编译一次。
+# 所有标记片段都包含同一个字面量，不含它的行（绝大多数）只需一次子串查找即可原样保留
+_MARKER_LITERAL = 'TMUX_CMD_'
+# 标记输出 (必须独占一行)：退出码与批次结束标记
+_MARKER_OUTPUT_PART = re.compile(r'TMUX_CMD_(?:EXIT_CODE_\d+:\d+|DONE_\d+)[ \t]*$')
+# 批量提交时包裹整行的 `while :; do`（仅当同一行包含标记时移除）
+_BATCH_PREFIX_PART = re.compile(r'while :; do (?=.*' + re.escape(_MARKER_LITERAL) + ')')
+# 非末尾命令之后的退出码检查片段，替换为 ';' 以保留命令分隔
+_GUARD_PART = re.compile(
+    re.escape(';__tmux_rc=$?;echo "TMUX_CMD_EXIT_CODE_') + r'\d+'
+    + re.escape(':$__tmux_rc";case $__tmux_rc in ') + r'[\d|]+'
+    + re.escape(') ;; *) break;; esac;')
+)
+# 末尾命令之后的退出码回显与批次结束标记，直接移除
+_COMMAND_PART = re.compile(
+    re.escape(';echo "TMUX_CMD_EXIT_CODE_') + r'\d+'
+    + re.escape(':$?";') + r'(?:break;done;)?'
+    + re.escape('echo "TMUX_CMD_DONE_') + r'\d+"'
+)
 
 class ExecutionPolicy:
     """一个封装了命令执行成功/失败规则的静态策略类。"""
-    _rules: Dict[str, List[int]] = {
-        "grep": [0, 1],
-        "diff": [0, 1]
+    # 以规则前缀的第一个词为键，每个键下按添加顺序保存 (完整前缀, 退出码)；
+    # 查找时先一次字典访问取出同名命令的规则，再逐条比较完整前缀
+    _rules: Dict[str, List[Tuple[str, List[int]]]] = {
+        "grep": [("grep", [0, 1])],
+        "diff": [("diff", [0, 1])]
     }
     default_accepted_codes: List[int] = [0]
 
     @classmethod
     def add_rule(cls, command_prefix: str, accepted_codes: List[int]):
-        """为以特定前缀开头的命令添加一条全局规则。"""
-        cls._rules[command_prefix] = accepted_codes
+        """为以特定前缀开头的命令添加一条全局规则；前缀可以包含多个词，如 "git diff"。"""
+        command_prefix = command_prefix.strip()
+        words = command_prefix.split(None, 1)
+        if not words:
+            raise ValueError("规则前缀不能为空。")
+        rules = cls._rules.setdefault(words[0], [])
+        for i, (prefix, _) in enumerate(rules):
+            if prefix == command_prefix:
+                rules[i] = (command_prefix, accepted_codes)
+                return
+        rules.append((command_prefix, accepted_codes))
 
     @classmethod
     def get_accepted_codes(cls, command_string: str) -> List[int]:
         """根据给定的命令字符串，获取其可接受的退出码列表。"""
-        for prefix, codes in cls._rules.items():
-            if command_string.strip().startswith(prefix):
+        command_string = command_string.strip()
+        words = command_string.split(None, 1)
+        if not words:
+            return cls.default_accepted_codes
+        for prefix, codes in cls._rules.get(words[0], ()):
+            if command_string.startswith(prefix):
                 return codes
         return cls.default_accepted_codes
 
@@ -35,6 +83,11 @@ class CommandResult:
         output = terminal_instance.capture_clean_output()
         CommandResult.last_output = output
 
+    @staticmethod
+    async def save_from_terminal_async(terminal_instance: 'TmuxTerminal'):
+        output = await terminal_instance.capture_clean_output_async()
+        CommandResult.last_output = output
+
     @staticmethod
     def get() -> Optional[str]:
         return CommandResult.last_output
@@ -43,186 +96,431 @@ class CommandResult:
     def clear():
         CommandResult.last_output = None
 
-@singledispatch
-def _execute_dispatcher(command: Union[str, list, tuple], term_instance: 'TmuxTerminal') -> bool:
-    raise TypeError(f"不支持的命令类型: {type(command)}")
+async def _ask_to_continue(prompt: str) -> bool:
+    """询问用户是否继续执行后续命令；input() 在线程中运行，不阻塞事件循环。"""
+    choice = (await asyncio.to_thread(input, prompt)).lower().strip()
+    if choice == 'y':
+        print("    用户选择继续执行。")
+        return True
+    else:
+        print("    用户选择中止。")
+        return False
+
+def _build_batch_line(commands: List[str], marker_ids: List[int]) -> str:
+    """
+    将一批命令拼接为一行 shell 输入，只需一次 send-keys。
+
+    每条命令后回显各自的退出码标记；除最后一条外，还会按 ExecutionPolicy 检查退出码，
+    不可接受时通过 break 跳出 `while :; do ... done`，从而保留“失败即停止”的语义。
+    最后回显 `TMUX_CMD_DONE_<首个标记号>` 作为整批结束的信号。
+    """
+    done_marker = f"echo \"TMUX_CMD_DONE_{marker_ids[0]}\""
+    if len(commands) == 1:
+        return f"{commands[0]};echo \"TMUX_CMD_EXIT_CODE_{marker_ids[0]}:$?\";{done_marker}"
+
+    parts = []
+    for command, marker_id in zip(commands[:-1], marker_ids[:-1]):
+        accepted = '|'.join(str(code) for code in ExecutionPolicy.get_accepted_codes(command))
+        parts.append(
+            f"{command};__tmux_rc=$?;echo \"TMUX_CMD_EXIT_CODE_{marker_id}:$__tmux_rc\";"
+            f"case $__tmux_rc in {accepted}) ;; *) break;; esac;"
+        )
+    parts.append(f"{commands[-1]};echo \"TMUX_CMD_EXIT_CODE_{marker_ids[-1]}:$?\";break;")
+    return f"while :; do {''.join(parts)}done;{done_marker}"
+
+async def _submit_batch(commands: List[str], term_instance: 'TmuxTerminal') -> Optional[List[Optional[int]]]:
+    """
+    一次性提交一批命令并等待其全部结束。
 
-@_execute_dispatcher.register(str)
-def _execute_str(command_string: str, term_instance: 'TmuxTerminal') -> bool:
+    Returns:
+        与 commands 一一对应的退出码列表，未运行或无法确定的项为 None；
+        等待过程出错时返回 None。
+    """
     pane = term_instance._pane
     if not pane: raise RuntimeError("Tmux 会话尚未初始化。")
 
-    print(f"> {repr(command_string)}")
-
-    # 等待提示符准备就绪
-    def wait_for_prompt_ready(max_attempts=10, wait_interval=0.2):
-        """等待终端提示符准备就绪"""
-        for attempt in range(max_attempts):
-            time.sleep(wait_interval)
-            output_lines = pane.capture_pane()
-            if output_lines:
-                last_line = output_lines[-1].strip()
-                # 检查最后一行是否看起来像提示符（包含常见的提示符字符）
-                if any(char in last_line for char in ['$', '>', '➜', '#', '%']) and len(last_line) > 0:
-                    # 再等待一小段时间确保提示符完全加载
-                    time.sleep(0.1)
-                    return True
-        return False
+    for command in commands:
+        print(f"> {repr(command)}")
 
-    # 等待提示符准备
-    if not wait_for_prompt_ready():
-        print(f"[⚠️] 警告: 提示符可能未完全加载，继续执行命令...")
+    marker_ids = list(range(term_instance._command_counter, term_instance._command_counter + len(commands)))
+    term_instance._command_counter += len(commands)
 
-    channel_name = f"tmux-wait-{term_instance._command_counter}"
-    exit_code_marker = f"TMUX_CMD_EXIT_CODE_{term_instance._command_counter}"
-    term_instance._command_counter += 1
+    # 不轮询 capture-pane：上一批结束后 shell 重新输出提示符时由 %output 通知唤醒。
+    # 在 readline 接管终端前输入的字符会被终端回显一次，造成命令行在捕获结果中重复出现
+    await term_instance._wait_for_prompt()
+    done = term_instance._expect_batch_done(marker_ids[0])
+    await term_instance._control.send_keys_async(pane.pane_id, _build_batch_line(commands, marker_ids))
 
-    full_command = f"{command_string};echo \"{exit_code_marker}:$?\";tmux wait-for -S \"{channel_name}\""
-    pane.send_keys(full_command, enter=True)
-    
     try:
-        term_instance._server.cmd('wait-for', channel_name)
+        await asyncio.wrap_future(done)
     except Exception as e:
-        print(f"[!!] 等待命令 '{command_string}' 完成时出错: {e}")
-        return False
+        print(f"[!!] 等待命令 {commands} 完成时出错: {e}")
+        return None
 
-    time.sleep(0.1)
-    output_lines = pane.capture_pane()
-    
-    exit_code = -1
-    for line in reversed(output_lines):
-        if line.strip().startswith(exit_code_marker):
-            try:
-                exit_code = int(line.strip().split(':')[1])
-                break
-            except (IndexError, ValueError): continue
-    
-    if exit_code == -1:
-        print(f"[⚠️] 无法确定命令 '{command_string}' 的退出状态码。")
-        choice = input("    请检查 tmux 会话的实际运行情况，并决定是否继续执行？(y/N): ").lower().strip()
-        if choice == 'y':
-            print("    用户选择继续执行。")
-            return True
-        else:
-            print("    用户选择中止。")
+    return [term_instance._exit_codes.pop(marker_id, None) for marker_id in marker_ids]
+
+async def _run_commands(commands: List[str], term_instance: 'TmuxTerminal') -> bool:
+    """按批提交命令；某条命令失败且用户选择继续时，将剩余命令作为新的一批重新提交。"""
+    pending = commands
+    while pending:
+        exit_codes = await _submit_batch(pending, term_instance)
+        if exit_codes is None:
             return False
 
-    accepted_codes = ExecutionPolicy.get_accepted_codes(command_string)
-    
-    if exit_code in accepted_codes:
-        return True
-    else:
-        print(f"[⚠️] 命令 '{command_string}' 返回了非预期退出码: {exit_code}")
-        choice = input("    检测到命令可能执行失败，是否继续执行？(y/N): ").lower().strip()
-        if choice == 'y':
-            print("    用户选择继续执行。")
-            return True
+        for index, (command, exit_code) in enumerate(zip(pending, exit_codes)):
+            if exit_code is None:
+                print(f"[⚠️] 无法确定命令 '{command}' 的退出状态码。")
+                if not await term_instance._should_continue(command, exit_code):
+                    return False
+                break
+
+            if exit_code not in ExecutionPolicy.get_accepted_codes(command):
+                print(f"[⚠️] 命令 '{command}' 返回了非预期退出码: {exit_code}")
+                if not await term_instance._should_continue(command, exit_code):
+                    return False
+                break
         else:
-            print("    用户选择中止。")
-            return False
+            return True
+
+        pending = pending[index + 1:]
+    return True
+
+async def _execute_dispatcher(command: Union[str, list, tuple], term_instance: 'TmuxTerminal') -> bool:
+    # 只有两种命令形式，直接用 isinstance 分派，省去 singledispatch 每次调用时按类型查找实现的开销
+    if isinstance(command, str):
+        return await _execute_str(command, term_instance)
+    if isinstance(command, (list, tuple)):
+        return await _execute_list(command, term_instance)
+    raise TypeError(f"不支持的命令类型: {type(command)}")
 
-@_execute_dispatcher.register(list)
-@_execute_dispatcher.register(tuple)
-def _execute_list(command_list: Union[List[str], Tuple[str]], term_instance: 'TmuxTerminal') -> bool:
+async def _execute_str(command_string: str, term_instance: 'TmuxTerminal') -> bool:
+    return await _run_commands([command_string], term_instance)
+
+async def _execute_list(command_list: Union[List[str], Tuple[str]], term_instance: 'TmuxTerminal') -> bool:
+    commands = []
     for command in command_list:
         if not isinstance(command, str):
             print(f"[!!] 命令列表中的项目必须是字符串，但收到了 {type(command)}。正在跳过。")
             continue
-        
-        success = _execute_dispatcher(command, term_instance)
-        
-        if not success:
-            print(f"\n[!!] 由于上一条命令失败或用户中止，正在停止后续命令的执行。")
-            return False
-    return True
+        commands.append(command)
 
-def _word_to_regex(word: str) -> str:
+    success = await _run_commands(commands, term_instance)
+
+    if not success:
+        print(f"\n[!!] 由于上一条命令失败或用户中止，正在停止后续命令的执行。")
+    return success
+
+class TmuxControlClient:
     """
-    将一个单词转换为一个正则表达式模式，该模式允许字符之间存在任意的空白（包括换行符）。
+    一个常驻的 tmux 控制模式 (tmux -C) 客户端。
+
+    所有命令通过同一条管道发送，避免每次调用都 fork/exec 一个 tmux 客户端进程。
+    tmux 按提交顺序处理命令，并用 %begin/%end（或 %error）包裹每条命令的输出，
+    因此只需一个先进先出的队列即可把响应与请求对应起来。
+
+    窗格输出以 %output 通知的形式到达，交给 on_output(pane_id, data) 回调；
+    客户端退出时调用 on_exit()。两个回调都在读取线程中执行，应尽快返回。
     """
-    return r'\s*'.join(re.escape(c) for c in word)
+    def __init__(self, session_name: str,
+                 on_output: Optional[Callable[[str, str], None]] = None,
+                 on_exit: Optional[Callable[[], None]] = None):
+        self.session_name = session_name
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self._proc: Optional[subprocess.Popen] = None
+        self._pending: Deque[Future] = deque()
+        self._write_lock = threading.Lock()
+        self._reader: Optional[threading.Thread] = None
+
+    def start(self):
+        self._proc = subprocess.Popen(
+            ['tmux', '-C', 'attach-session', '-t', self.session_name],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0
+        )
+        self._reader = threading.Thread(target=self._read_responses, name='tmux-control', daemon=True)
+        self._reader.start()
+
+    def _read_responses(self):
+        """后台线程：解析 %begin/%end/%error 响应块，并转发 %output 通知。"""
+        block: Optional[List[str]] = None
+        block_id = None
+        for raw_line in self._proc.stdout:
+            if block is None and raw_line.startswith(b'%output '):
+                if self.on_output:
+                    _, pane_id, data = raw_line.rstrip(b'\n').split(b' ', 2)
+                    # tmux 把控制字符和反斜杠转义为 \ooo 八进制形式
+                    data = _OCTAL_ESCAPE.sub(lambda m: bytes([int(m.group(1), 8)]), data)
+                    self.on_output(pane_id.decode(), data.decode('utf-8', errors='replace'))
+                continue
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\n')
+            if block is None:
+                if line.startswith('%begin '):
+                    fields = line.split(' ')
+                    # flags 第 1 位表示该命令来自本客户端；attach 自身的响应块不对应任何请求
+                    if len(fields) == 4 and int(fields[3]) & 1:
+                        block, block_id = [], fields[2]
+                continue
+
+            fields = line.split(' ')
+            if fields[0] in ('%end', '%error') and len(fields) == 4 and fields[2] == block_id:
+                # 没有对应请求的响应块（理论上不应出现）直接丢弃，不能让读取线程因此退出
+                if self._pending:
+                    future = self._pending.popleft()
+                    if fields[0] == '%end':
+                        future.set_result(block)
+                    else:
+                        future.set_exception(RuntimeError('\n'.join(block)))
+                block = None
+            else:
+                block.append(line)
+
+        # 控制客户端已退出，唤醒所有仍在等待的调用者
+        while self._pending:
+            self._pending.popleft().set_exception(RuntimeError("tmux 控制模式客户端已退出。"))
+        if self.on_exit:
+            self.on_exit()
+
+    def _submit(self, *commands: Tuple[str, ...]) -> List[Future]:
+        """把若干条 tmux 命令一次性写入管道，返回与之一一对应的 Future。"""
+        if not self._proc or self._proc.poll() is not None:
+            raise RuntimeError("tmux 控制模式客户端未运行。")
+        # 控制模式按 '\n' 切分命令，参数里的换行会让一条命令变成多条，响应与请求随之错位
+        if any('\n' in arg for args in commands for arg in args):
+            raise ValueError("tmux 控制模式命令的参数中不能包含换行符。")
+        futures = [Future() for _ in commands]
+        payload = ''.join(' '.join(shlex.quote(arg) for arg in args) + '\n' for args in commands)
+        with self._write_lock:
+            self._pending.extend(futures)
+            self._proc.stdin.write(payload.encode('utf-8'))
+        return futures
+
+    def command(self, *args: str) -> List[str]:
+        """执行一条 tmux 命令并阻塞等待其输出行。"""
+        return self._submit(args)[0].result()
+
+    async def command_async(self, *args: str) -> List[str]:
+        """执行一条 tmux 命令并异步等待其输出行，适合 wait-for 这类长时间阻塞的命令。"""
+        return await asyncio.wrap_future(self._submit(args)[0])
+
+    async def commands_async(self, *commands: Tuple[str, ...]) -> List[List[str]]:
+        """把多条 tmux 命令一次性写入管道，异步等待全部完成并按顺序返回各自的输出行。"""
+        return await asyncio.gather(*(asyncio.wrap_future(f) for f in self._submit(*commands)))
+
+    @staticmethod
+    def _send_keys_args(target: str, text: str, enter: bool) -> Tuple[str, ...]:
+        """
+        构造按字面量向目标窗格发送文本的 send-keys 命令。
+
+        回车以字面量 '\\r'（即终端中 Enter 键产生的字节）附在文本末尾，
+        从而文本与回车由同一条 send-keys 命令送达。文本中的换行同样按 Enter 键
+        发送为 '\\r'：控制模式的一行只能承载一条命令，原样的 '\\n' 会把它截断。
+        """
+        text = text.replace('\r\n', '\r').replace('\n', '\r')
+        if enter:
+            text += '\r'
+        return ('send-keys', '-t', target, '-l', '--', text)
+
+    def send_keys(self, target: str, text: str, enter: bool = True):
+        """按字面量向目标窗格发送文本并阻塞等待 tmux 确认。"""
+        self.command(*self._send_keys_args(target, text, enter))
+
+    async def send_keys_async(self, target: str, text: str, enter: bool = True):
+        """按字面量向目标窗格发送文本，异步等待 tmux 确认，不阻塞事件循环。"""
+        await self.command_async(*self._send_keys_args(target, text, enter))
+
+    def close(self):
+        if self._proc and self._proc.poll() is None:
+            # 关闭标准输入会让控制客户端自行分离并退出
+            self._proc.stdin.close()
+            self._proc.wait()
+        self._proc = None
 
 class TmuxTerminal:
-    """一个使用全局策略驱动的、用于顺序执行命令的 tmux 会话管理器。"""
-    def __init__(self, session_name: str, start_dir: Optional[str] = None):
+    """
+    一个使用全局策略驱动的、用于顺序执行命令的 tmux 会话管理器。
+
+    on_unexpected_exit(command, exit_code) 决定命令退出码不可接受（无法确定时为 None）后是否继续执行；
+    未提供时仅在交互式终端中询问用户，否则直接中止。
+    """
+    HISTORY_LIMIT = 50000
+
+    def __init__(self, session_name: str, start_dir: Optional[str] = None,
+                 on_unexpected_exit: Optional[Callable[[str, Optional[int]], bool]] = None):
         self.session_name = session_name
+        self._on_unexpected_exit = on_unexpected_exit
         self.is_running_cmd = False
         self.start_dir = os.path.abspath(start_dir or os.getcwd())
         self._server = libtmux.Server()
         self._session: Optional[libtmux.Session] = None
         self._pane: Optional[libtmux.Pane] = None
+        self._control: Optional[TmuxControlClient] = None
         self._command_counter = 0
+        # 以下状态由控制模式读取线程根据 %output 通知更新
+        self._output_tail = ''
+        self._exit_codes: Dict[int, int] = {}
+        self._batch_done: Dict[int, Future] = {}
+        self._prompt_ready: Optional[Future] = None
 
     def __enter__(self):
-        sessions = self._server.sessions.filter(session_name=self.session_name)
-        self._session = next(iter(sessions), None)
-        if self._session:
-            print(f"已连接到现有 Tmux 会话 '{self.session_name}'...")
-        else:
-            self._session = self._server.new_session(session_name=self.session_name)
+        # 直接尝试创建会话，由 tmux 在服务端按名称查重，无需列出全部会话再逐个比对；
+        # 会话与活动窗格的 ID 一并返回，省去 libtmux 再逐级查询窗口和窗格。
+        # history-limit 只对之后新建的窗格生效，因此要在同一次调用中先于 new-session 设为全局选项
+        id_format = '#{session_id} #{pane_id}'
+        proc = self._server.cmd(
+            'set-option', '-g', 'history-limit', str(self.HISTORY_LIMIT), ';',
+            'new-session', '-d', '-s', self.session_name, '-c', self.start_dir, '-P', '-F', id_format
+        )
+        created = not proc.stderr
+        if created:
+            session_id, pane_id = proc.stdout[0].split()
             print(f"已创建 Tmux 会话 '{self.session_name}'...")
-        
-        history_limit = 50000
-        self._session.set_option('history-limit', history_limit) 
-        
-        self._pane = self._session.active_window.active_pane
-        
-        time.sleep(0.5)
+        else:
+            session_id, pane_id = self._server.cmd('display-message', '-p', '-t', f'={self.session_name}:', id_format).stdout[0].split()
+            print(f"已连接到现有 Tmux 会话 '{self.session_name}'...")
+        self._session = libtmux.Session(server=self._server, session_id=session_id)
+        self._pane = libtmux.Pane(server=self._server, pane_id=pane_id)
+        if not created:
+            # 控制模式客户端接入现有会话时 shell 会重绘一次提示符，重绘期间输入的字符会丢失，
+            # 因此第一批命令要等到这次重绘之后再发送
+            self._prompt_ready = Future()
+        self._control = TmuxControlClient(
+            self.session_name, on_output=self._on_pane_output, on_exit=self._on_control_exit
+        )
+        self._control.start()
+
+        if created:
+            # 新建的 shell 处理到这条命令时即已就绪，无需固定等待
+            ready = self._expect_batch_done(self._command_counter)
+            self._control.send_keys(self._pane.pane_id, f"echo \"TMUX_CMD_DONE_{self._command_counter}\"")
+            self._command_counter += 1
+            ready.result()
         
         print(f"✨ 可在新终端使用以下命令连接会话: tmux attach -t {self.session_name}")
         return self
     
+    async def _should_continue(self, command: str, exit_code: Optional[int]) -> bool:
+        """命令失败或退出码未知时，决定是否继续执行后续命令。"""
+        if self._on_unexpected_exit is not None:
+            return self._on_unexpected_exit(command, exit_code)
+        if not sys.stdin.isatty():
+            print("    非交互式环境，停止执行。")
+            return False
+        if exit_code is None:
+            return await _ask_to_continue("    请检查 tmux 会话的实际运行情况，并决定是否继续执行？(y/N): ")
+        return await _ask_to_continue("    检测到命令可能执行失败，是否继续执行？(y/N): ")
+
+    def _expect_batch_done(self, batch_id: int) -> Future:
+        """登记一批命令，返回在窗格输出其结束标记时完成的 Future。"""
+        future = Future()
+        self._batch_done[batch_id] = future
+        return future
+
+    async def _wait_for_prompt(self, timeout: float = 1.0):
+        """等待上一批命令结束后的提示符出现；提示符为空等情况下最多等待 timeout 秒。"""
+        prompt_ready = self._prompt_ready
+        if prompt_ready is None:
+            return
+        try:
+            # shield 避免超时时取消 Future，否则读取线程稍后对其 set_result 会抛出异常
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(prompt_ready)), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _on_pane_output(self, pane_id: str, data: str):
+        """控制模式读取线程回调：从窗格输出中逐行识别退出码与批次结束标记。"""
+        if not self._pane or pane_id != self._pane.pane_id:
+            return
+        lines = (self._output_tail + data).split('\n')
+        tail = lines.pop()
+        # 过长的未完结行不可能是标记行，只保留末尾并加上 '\0' 前缀使其无法匹配
+        self._output_tail = tail if len(tail) <= 256 else '\0' + tail[-64:]
+        for line in lines:
+            if 'TMUX_CMD_' not in line:
+                continue
+            # 原始输出里可能夹杂控制序列和回车，只看光标回到行首之后真正显示的内容
+            line = _ANSI_CSI.sub('', line).rstrip().rpartition('\r')[2].strip()
+            match = _EXIT_CODE_LINE.match(line)
+            if match:
+                self._exit_codes[int(match.group(1))] = int(match.group(2))
+                continue
+            match = _BATCH_DONE_LINE.match(line)
+            if match:
+                future = self._batch_done.pop(int(match.group(1)), None)
+                if future:
+                    # 结束标记之后再出现的未换行输出即为新的提示符
+                    self._prompt_ready = Future()
+                    future.set_result(None)
+        prompt_ready = self._prompt_ready
+        if prompt_ready and not prompt_ready.done() and self._output_tail.strip():
+            prompt_ready.set_result(None)
+
+    def _on_control_exit(self):
+        while self._batch_done:
+            _, future = self._batch_done.popitem()
+            future.set_exception(RuntimeError("tmux 控制模式客户端已退出。"))
+
+    def _capture_history_args(self) -> Tuple[str, ...]:
+        return ("capture-pane", "-p", "-J", "-S-", "-E-", "-t", self._pane.pane_id)
+
+    def capture_history(self) -> List[str]:
+        """通过控制模式客户端捕获窗格的全部历史（软换行已合并）。"""
+        return self._control.command(*self._capture_history_args())
+
+    async def capture_history_async(self) -> List[str]:
+        """capture_history 的异步版本，等待 tmux 响应时不阻塞事件循环。"""
+        return await self._control.command_async(*self._capture_history_args())
+
     def capture_clean_output(self) -> str:
         """
         捕获并清理窗格输出。
+
+        使用 capture-pane -J 让 tmux 合并被软换行拆开的行，
+        因此标记可以按固定字面量匹配，无需容忍字符间的任意空白。
         """
         if not self._pane: return "[!!] 错误：无法捕获输出，因为 tmux 窗格不可用。"
-        full_output: List[str] = self._pane.cmd("capture-pane", "-p", "-S-", "-E-").stdout
+        return self._clean_output(self.capture_history())
 
-        lines_iter = iter(full_output)
+    async def capture_clean_output_async(self) -> str:
+        """capture_clean_output 的异步版本，供 execute_async 在事件循环中使用。"""
+        if not self._pane: return "[!!] 错误：无法捕获输出，因为 tmux 窗格不可用。"
+        return self._clean_output(await self.capture_history_async())
 
-        if not lines_iter:
+    @staticmethod
+    def _clean_output(captured_lines: List[str]) -> str:
+        """去掉捕获结果中的批处理包装与结束标记，并裁掉首尾空行。"""
+        if not captured_lines:
             return ""
 
-        full_output = '\n'.join(lines_iter)
-
-        # 定义标记命令的模式
-        command_part = (
-            r';'
-            r'\s*' + _word_to_regex('echo') + r'\s*'
-            r'"\s*' + _word_to_regex('TMUX_CMD_EXIT_CODE_') + r'.*?'
-            + re.escape(':$?') +
-            r'"'
-            r'\s*;\s*'
-            r'\s*' + _word_to_regex('tmux') + r'\s*'
-            r'\s*' + _word_to_regex('wait-for') + r'\s*'
-            r'-S\s*".*?"'
-        )
-
-        # 定义标记输出的模式 (必须在行首)
-        output_part = (
-            r'^\s*'
-            + _word_to_regex('TMUX_CMD_EXIT_CODE_')
-            + r'.*?'
-            + r':'
-            + r'[\s\d]*'
-        )
-
-        # 构建原子块模式，包含三个捕获组
-        atomic_block_pattern = re.compile(
-            f"({command_part})"  # 组 1: 标记命令
-            f"(.*?)"             # 组 2: 真实输出 (我们想保留的内容)
-            f"({output_part})",  # 组 3: 标记输出
-            re.DOTALL | re.MULTILINE
-        )
-
-        # 关键：使用回溯引用 r'\2' 替换整个区块，从而只保留真实输出
-        cleaned_text = atomic_block_pattern.sub(r'\2', full_output)
-        
-        return cleaned_text.strip()
+        # 单次遍历：只有含标记字面量的行才做正则处理，其余行原样保留
+        cleaned_lines: List[str] = []
+        for line in captured_lines:
+            if _MARKER_LITERAL in line:
+                if _MARKER_OUTPUT_PART.match(line):
+                    continue
+                line = _BATCH_PREFIX_PART.sub('', line)
+                line = _GUARD_PART.sub(';', line)
+                # 命令行恰好占满一整行时 readline 会主动折行，-J 会把下一行输出也接到它后面；
+                # 结束标记之后不可能再有同一行的输入，把它替换为换行即可拆开
+                line = _COMMAND_PART.sub('\n', line).rstrip('\n')
+            cleaned_lines.append(line)
+
+        # 在行列表上去掉首尾空白，等价于 join 之后再 strip()，但省去一次整段输出的复制
+        first = next((i for i, line in enumerate(cleaned_lines) if line.strip()), None)
+        if first is None:
+            return ""
+        last = next(i for i in range(len(cleaned_lines) - 1, -1, -1) if cleaned_lines[i].strip())
+        cleaned_lines = cleaned_lines[first:last + 1]
+        cleaned_lines[0] = cleaned_lines[0].lstrip()
+        cleaned_lines[-1] = cleaned_lines[-1].rstrip()
+        return '\n'.join(cleaned_lines)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        choice = input("运行完成，是否需要关闭此 Tmux 会话？(y/N): ").lower().strip()
+        if self._control:
+            self._control.close()
+        # 仅在交互式终端中询问；脚本/服务场景（或设置了 TMUX_KEEP_ON_EXIT）直接保留会话，不阻塞退出
+        choice = 'n'
+        if sys.stdin.isatty() and not os.environ.get('TMUX_KEEP_ON_EXIT'):
+            choice = input("运行完成，是否需要关闭此 Tmux 会话？(y/N): ").lower().strip()
         if choice == 'y':
             print(f"正在关闭 Tmux 会话 '{self.session_name}'...")
             if self._server.has_session(self.session_name): self._server.kill_session(self.session_name)
@@ -230,18 +528,31 @@ class TmuxTerminal:
         else:
             print(f"脚本已结束，Tmux 会话 '{self.session_name}' 仍在后台运行（如果未退出）。")
 
-    def execute(self, command: Union[str, List[str]]):
+    def execute(self, command: Union[str, List[str]], capture: bool = True):
+        """同步执行命令；不能在正在运行的事件循环中调用，此时请改用 execute_async。"""
+        asyncio.run(self.execute_async(command, capture))
+
+    async def execute_async(self, command: Union[str, List[str]], capture: bool = True):
+        """
+        执行命令并把清理后的窗格输出保存到 CommandResult。
+
+        capture 为 False 时只按退出码判断成败：不重置窗格、不捕获输出，CommandResult 被清空。
+        """
         if self.is_running_cmd:
             print("正在运行中，请稍后传入命令")
             return
         self.is_running_cmd = True
-        if self._pane:
-            self._pane.clear()
-            self._pane.cmd('clear-history')
-            time.sleep(0.2)
+        if self._pane and capture:
+            # 在 tmux 端重置屏幕并清空历史，两条命令一次写入控制管道；
+            # 不再向 shell 输入 `reset`，也就无需等待它执行完毕
+            pane_id = self._pane.pane_id
+            await self._control.commands_async(('send-keys', '-R', '-t', pane_id), ('clear-history', '-t', pane_id))
         try:
-            _execute_dispatcher(command, self)
-            CommandResult.save_from_terminal(self)
+            await _execute_dispatcher(command, self)
+            if capture:
+                await CommandResult.save_from_terminal_async(self)
+            else:
+                CommandResult.clear()
         finally:
             self.is_running_cmd = False
 
@@ -1,35 +1,64 @@
 import asyncio
+import random
 import websockets
-import json
+import orjson
 
 class WebSocketClient:
+    # 重连等待从 1 秒起每次失败翻倍，最长 60 秒，并叠加随机抖动，避免多个客户端同时重连
+    RECONNECT_MIN_DELAY = 1.0
+    RECONNECT_MAX_DELAY = 60.0
+    CONNECT_TIMEOUT = 10
+    # 事件队列的容量；没有人消费时只保留最新的消息，内存占用有上限
+    EVENT_QUEUE_SIZE = 1024
+
     def __init__(self, uri, client_id):
         self.uri = uri
         self.client_id = client_id
+        # 身份声明在每次重连时都会发送，只需编码一次
+        self._identity = orjson.dumps({"client_id": client_id})
         self.websocket = None
-        self.event_queue = asyncio.Queue()  # 用于消息事件的队列
+        self.event_queue = asyncio.Queue(maxsize=self.EVENT_QUEUE_SIZE)  # 用于消息事件的队列
+        self._dropped_events = 0
 
     async def connect(self):
+        delay = self.RECONNECT_MIN_DELAY
         while True:
             try:
-                # 尝试连接到 WebSocket 服务器
-                self.websocket = await websockets.connect(self.uri)
+                # 尝试连接到 WebSocket 服务器，连接阶段设置超时，避免无限期挂起
+                self.websocket = await asyncio.wait_for(
+                    websockets.connect(self.uri, compression=None), self.CONNECT_TIMEOUT
+                )
                 print("Connected to server")
+                delay = self.RECONNECT_MIN_DELAY
 
                 # 连接后发送身份声明
-                await self.websocket.send(json.dumps({"client_id": self.client_id}))
+                await self.websocket.send(self._identity, text=True)
 
-                # 持续监听消息
+                # 持续监听消息；连接关闭后立即尝试重连
                 await self.listen()
 
             except Exception as e:
+                wait = delay + random.uniform(0, delay * 0.5)
                 print(f"Connection failed: {e}")
-                print("Reconnecting in 5 seconds...")
-                await asyncio.sleep(5)
+                print(f"Reconnecting in {wait:.1f} seconds...")
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
 
     async def send_message(self, target_id, message):
+        """
+        向目标客户端发送消息。
+
+        message 为 str 时作为 JSON 文本字符串嵌入；为 bytes 时视为已编码好的 JSON 值，
+        直接拼入消息帧，避免对载荷再做一次编码。
+        """
         if self.websocket:
-            await self.websocket.send(json.dumps({"target_id": target_id, "message": message}))
+            if isinstance(message, bytes):
+                frame = b'{"target_id":' + orjson.dumps(target_id) + b',"message":' + message + b'}'
+                # 日志中显示解码后的 JSON 文本，而不是 bytes 的 repr
+                message = message.decode('utf-8', errors='replace')
+            else:
+                frame = orjson.dumps({"target_id": target_id, "message": message})
+            await self.websocket.send(frame, text=True)
             print(f"Sent message to {target_id}: {message}")
 
     async def listen(self):
@@ -37,10 +66,27 @@ class WebSocketClient:
             async for message in self.websocket:
                 # 当收到消息时，触发事件，将消息放入事件队列
                 await self.on_message(message)
-                await self.event_queue.put(message)  # 放入队列中供其他程序监听
+                self._put_event(message)  # 放入队列中供其他程序监听
         except websockets.ConnectionClosed:
             print("Connection closed, attempting to reconnect...")
 
+    def _put_event(self, message):
+        """放入事件队列；队列已满时丢弃最旧的一条，不阻塞接收循环。"""
+        try:
+            self.event_queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        try:
+            self.event_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        self.event_queue.put_nowait(message)
+        # 只在第一次及此后每丢弃 1000 条时提示一次
+        if self._dropped_events % 1000 == 0:
+            print(f"Event queue full, dropping oldest messages ({self._dropped_events + 1} dropped so far)")
+        self._dropped_events += 1
+
     async def close(self):
         if self.websocket:
             await self.websocket.close()
@@ -52,7 +98,6 @@ class WebSocketClient:
 
     async def get_event(self):
         """其他程序可以通过这个方法来监听消息事件"""
-        loop = asyncio.get_event_loop()  # 确认在当前事件循环中运行
         return await self.event_queue.get()  # 从队列中获取消息
 
 if __name__ == "__main__":
@@ -85,4 +130,10 @@ if __name__ == "__main__":
         # 确保任务不会立即退出
         await asyncio.gather(connect_task)
 
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop 仅支持 POSIX；未安装时（例如 Windows）使用标准事件循环
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
\ No newline at end of file
@@ -1,27 +1,35 @@
 import asyncio
+import logging
+import logging.handlers
+import queue
 import websockets
-import json
+import orjson
 
-class WebSocketServer:
-    connected_clients = {}
+# 日志经由队列交给后台线程写出，事件循环里不做同步的标准输出写入
+logger = logging.getLogger("wsserver")
 
+class WebSocketServer:
     def __init__(self, host='localhost', port=8765, on_message_callback=None):
         self.host = host
         self.port = port
         self.server = None
         self.on_message_callback = on_message_callback  # 添加回调函数
+        # 实例级的连接表：websocket -> 客户端信息，以及按 ID 查找连接的反向索引
+        self.connected_clients = {}
+        self.clients_by_id = {}
 
     async def handle_client(self, websocket):
         try:
             # 接收客户端识别消息
             identification_msg = await websocket.recv()
-            client_info = json.loads(identification_msg)
+            client_info = orjson.loads(identification_msg)
 
             if 'client_id' in client_info:
                 client_id = client_info['client_id']
-                WebSocketServer.connected_clients[websocket] = {"id": client_id}
+                self.connected_clients[websocket] = {"id": client_id}
+                self.clients_by_id[client_id] = websocket
 
-                print(f"[+] {client_id}")
+                logger.info("[+] %s", client_id)
 
                 # 给客户端一个确认消息
                 await websocket.send(f"Welcome {client_id}")
@@ -40,23 +48,25 @@ class WebSocketServer:
                 await websocket.close()
 
         except websockets.ConnectionClosed:
-            print(f"Client disconnected unexpectedly: {WebSocketServer.connected_clients.get(websocket, {}).get('id', 'Unknown')}")
+            logger.warning("Client disconnected unexpectedly: %s", self.connected_clients.get(websocket, {}).get('id', 'Unknown'))
         finally:
-            if websocket in WebSocketServer.connected_clients:
-                client_id = WebSocketServer.connected_clients[websocket]['id']
-                del WebSocketServer.connected_clients[websocket]
-                print(f"[-] {client_id}")
+            if websocket in self.connected_clients:
+                client_id = self.connected_clients[websocket]['id']
+                self._remove_client(websocket)
+                logger.info("[-] %s", client_id)
 
     async def handle_message(self, message, sender_id):
         try:
             # 尝试解析消息为 JSON
-            message_data = json.loads(message)
+            message_data = orjson.loads(message)
             target_id = message_data.get("target_id")
             text_message = message_data.get("message")
 
             if target_id and text_message:
                 # 发送消息到目标客户端
-                dumped_message = json.dumps({"s": sender_id, "m": json.loads(text_message)})
+                # message 可以是 JSON 文本字符串，也可以是发送方直接嵌入的 JSON 值
+                payload = orjson.loads(text_message) if isinstance(text_message, str) else text_message
+                dumped_message = orjson.dumps({"s": sender_id, "m": payload})
                 if target_id == "Server": return
                 success = await self.send_to_client(target_id, dumped_message)
 
@@ -65,40 +75,45 @@ class WebSocketServer:
             else:
                 # 如果消息格式不正确，发送错误信息回客户端
                 await self.send_error(sender_id, "Error: Invalid message format.")
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             await self.send_error(sender_id, "Error: Failed to decode message.")
 
+    def _remove_client(self, websocket):
+        client_info = self.connected_clients.pop(websocket, None)
+        # 同一 ID 可能已由新连接接管，只有索引仍指向这条连接时才移除
+        if client_info and self.clients_by_id.get(client_info["id"]) is websocket:
+            del self.clients_by_id[client_info["id"]]
+
     async def send_to_client(self, target_id, message):
-        # 查找目标客户端
-        found = False
-        for client_websocket, client_info in WebSocketServer.connected_clients.items():
-            if client_info["id"] == target_id:
-                try:
-                    await client_websocket.send(message)
-                    found = True
-                    break
-                except websockets.ConnectionClosed:
-                    # 如果目标客户端连接关闭，移除它
-                    del WebSocketServer.connected_clients[client_websocket]
-
-        # 返回是否成功找到目标客户端
-        return found
+        # 按 ID 直接查找目标客户端，返回是否成功发送
+        client_websocket = self.clients_by_id.get(target_id)
+        if client_websocket is None:
+            return False
+        try:
+            # orjson 产出的是 UTF-8 字节，text=True 让它仍以文本帧发送，无需先解码
+            await client_websocket.send(message, text=True)
+            return True
+        except websockets.ConnectionClosed:
+            # 如果目标客户端连接关闭，移除它
+            self._remove_client(client_websocket)
+            return False
 
     async def send_error(self, sender_id, error_message):
         # 向发送者客户端发送错误信息
-        for client_websocket, client_info in WebSocketServer.connected_clients.items():
-            if client_info["id"] == sender_id:
-                try:
-                    await client_websocket.send(error_message)
-                    return
-                except websockets.ConnectionClosed:
-                    # 如果发送者连接关闭，移除它
-                    del WebSocketServer.connected_clients[client_websocket]
+        client_websocket = self.clients_by_id.get(sender_id)
+        if client_websocket is None:
+            return
+        try:
+            await client_websocket.send(error_message)
+        except websockets.ConnectionClosed:
+            # 如果发送者连接关闭，移除它
+            self._remove_client(client_websocket)
 
     # 启动 WebSocket 服务器
     async def start(self):
-        self.server = await websockets.serve(self.handle_client, self.host, self.port)
-        print(f"WebSocket server started on ws://{self.host}:{self.port}")
+        # 消息都是本机转发的小段 JSON，压缩只会白白消耗 CPU
+        self.server = await websockets.serve(self.handle_client, self.host, self.port, compression=None)
+        logger.info("WebSocket server started on ws://%s:%s", self.host, self.port)
         await asyncio.Future()  # 保持服务器运行
 
     # 停止 WebSocket 服务器
@@ -106,13 +121,32 @@ class WebSocketServer:
         if self.server:
             self.server.close()
             await self.server.wait_closed()
-            print("WebSocket server stopped")
+            logger.info("WebSocket server stopped")
 
 # 示例回调函数
 def custom_message_handler(message):
-    print(f"Custom handler received message: {message}")
+    logger.info("Custom handler received message: %s", message)
+
+def start_log_listener(level=logging.INFO) -> logging.handlers.QueueListener:
+    """把 wsserver 日志接到队列上，由后台线程写到标准错误；返回的监听器需在退出时 stop()。"""
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    return listener
 
 # 如果需要单独启动，可以加入入口
 if __name__ == "__main__":
+    log_listener = start_log_listener()
     ws_server = WebSocketServer(on_message_callback=custom_message_handler)
-    asyncio.run(ws_server.start())
+    try:
+        # uvloop 仅支持 POSIX；未安装时（例如 Windows）使用标准事件循环
+        try:
+            import uvloop
+        except ImportError:
+            asyncio.run(ws_server.start())
+        else:
+            uvloop.run(ws_server.start())
+    finally:
+        log_listener.stop()